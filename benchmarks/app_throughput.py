@@ -0,0 +1,283 @@
+"""
+End-to-end throughput of the app: redirects, shortening and the click flush.
+
+Runs src.main.app in-process (lifespan included) through an httpx ASGI
+client, against a local Postgres and a local redis-server or fakeredis,
+seeds --links links and prints one JSON document:
+
+    python -m benchmarks.app_throughput --links 100000 --output before.json
+    python -m benchmarks.compare before.json after.json
+
+Phases: redirect_cold (first hit of each code, resolved from the database),
+redirect_warm (the same codes again, served from the caches), shorten
+(anonymous POST /tinylink/links/shorten) and flush (the aggregator applying
+the recorded click events plus one flush_click_counters cycle).
+
+The database is migrated to head and its links are deleted, its name has
+to contain "bench". The Redis database is flushed. --redis-url fakeredis
+runs an in-memory server in this process instead of redis-server.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+
+SEED_BATCH_SIZE = 100_000
+SEED_COLUMNS = ("code_id", "id", "original_url", "short_code", "created", "expires_at", "usage_count", "is_active", "url_digest")
+
+
+def configure_environment(args) -> None:
+    """
+    The app reads its settings at import time, so this runs before src is imported.
+    """
+    url = make_url(args.database_url)
+    if "bench" not in (url.database or ""):
+        sys.exit(f"Refusing to delete the links of {url.database!r}, use a database named *bench*")
+    os.environ.update(
+        DB_USER=url.username or "", DB_PASS=url.password or "", DB_HOST=url.host or "localhost",
+        DB_PORT=str(url.port or 5432), DB_NAME=url.database,
+        REDIS_URL=args.redis_url,
+        # Sized for the seeded links, the filter bits are computed at import
+        BLOOM_CAPACITY=str(max(2 * (args.links + args.shorten), 1000)),
+    )
+    for name, default in (("SECRET", "benchmark"), ("ALGORITHM", "HS256"), ("DEACTIVATION_DAYS", "30")):
+        os.environ.setdefault(name, default)
+
+
+def start_fake_redis() -> str:
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    # Connections left open by the app's pools must not keep the process alive
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return f"redis://{host}:{port}/0"
+
+
+def migrate() -> None:
+    from alembic import command
+    from alembic.config import Config
+
+    command.upgrade(Config(os.path.join(os.path.dirname(os.path.dirname(__file__)), "alembic.ini")), "head")
+
+
+async def seed_links(count: int) -> list[str]:
+    """
+    Registered links with code IDs 0..count, written with COPY.
+    """
+    from src.database import async_session_maker, engine
+    from src.tinylink.codes import code_permutations
+    from src.tinylink.partitions import ensure_link_partitions
+
+    async with async_session_maker() as session:
+        await session.execute(text("DELETE FROM linkdata"))
+        # Redis is flushed with the stream, the offsets of its consumers go too
+        await session.execute(text("DELETE FROM click_stream_offsets"))
+        await ensure_link_partitions(session)
+        await session.commit()
+
+    permutation = code_permutations[6]
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=30)
+    codes = []
+    async with engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        for start in range(0, count, SEED_BATCH_SIZE):
+            records = []
+            for code_id in range(start, min(start + SEED_BATCH_SIZE, count)):
+                short_code = permutation.encode(code_id)
+                url = f"https://example.com/{short_code}"
+                records.append((
+                    code_id, uuid.uuid4(), url, short_code, now, expires_at, 0, True,
+                    hashlib.md5(url.encode()).digest(),
+                ))
+                codes.append(short_code)
+            await raw.copy_records_to_table("linkdata", records=records, columns=SEED_COLUMNS)
+        await conn.commit()
+    return codes
+
+
+def summarize(latencies: list[float], elapsed: float, errors: int) -> dict:
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "per_sec": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+        "p99_ms": round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 3) if latencies else None,
+    }
+
+
+async def run_requests(send, items: list, concurrency: int, expected_status: int) -> dict:
+    latencies = []
+    errors = 0
+    queue = iter(items)
+
+    async def worker():
+        nonlocal errors
+        for item in queue:
+            started = time.perf_counter()
+            response = await send(item)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != expected_status:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def flush_clicks(visitor_sketches: bool) -> dict:
+    """
+    What the aggregator and the flush_click_counters task do with the
+    events recorded by the redirect phases. fakeredis' server cannot send
+    the binary HyperLogLog values, the sketches are skipped with it.
+    """
+    from src.config import CLICK_BATCH_SIZE
+    from src.database import async_session_maker
+    from src.redis_client import get_raw_redis_client, get_redis_client
+    from src.tasks.aggregator import apply_click_events
+    from src.tinylink.analytics import rollup_click_buckets
+    from src.tinylink.events import CLICK_GROUP, CLICK_STREAM
+    from src.tinylink.visitors import persist_visitor_sketches
+
+    redis_client = get_redis_client()
+    events = 0
+    started = time.perf_counter()
+    while True:
+        response = await redis_client.xreadgroup(CLICK_GROUP, "benchmark", {CLICK_STREAM: ">"}, count=CLICK_BATCH_SIZE)
+        entries = response[0][1] if response else []
+        if not entries:
+            break
+        await apply_click_events(async_session_maker, redis_client, "benchmark", entries)
+        events += len(entries)
+    applied = time.perf_counter() - started
+    await rollup_click_buckets(async_session_maker, redis_client)
+    if visitor_sketches:
+        await persist_visitor_sketches(async_session_maker, redis_client, get_raw_redis_client())
+    elapsed = time.perf_counter() - started
+    return {
+        "events": events,
+        "seconds": round(elapsed, 3),
+        "apply_seconds": round(applied, 3),
+        "events_per_sec": round(events / applied, 1) if applied else None,
+        "visitor_sketches": visitor_sketches,
+    }
+
+
+async def benchmark(args) -> dict:
+    from httpx import ASGITransport, AsyncClient
+    from redis import asyncio as aioredis
+
+    from src.database import async_session_maker
+    from src.main import app
+    from src.tasks.aggregator import ensure_consumer_group
+    from src.tinylink.bloom import rebuild_bloom_filter
+
+    redis_client = aioredis.from_url(args.redis_url, decode_responses=True)
+    await redis_client.flushdb()
+
+    started = time.perf_counter()
+    codes = await seed_links(args.links)
+    seeded = time.perf_counter() - started
+    # Built before startup, the lifespan's rebuild then finds it fresh
+    await rebuild_bloom_filter(async_session_maker, redis_client)
+    await ensure_consumer_group(redis_client)
+    await redis_client.aclose()
+
+    random.seed(args.seed)
+    sample = random.sample(codes, min(args.requests, len(codes)))
+    results = {}
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://benchmark") as client:
+            def redirect(short_code):
+                return client.get(f"/tinylink/link/{short_code}", headers={"user-agent": "Mozilla/5.0"})
+
+            def shorten(index):
+                return client.post(
+                    "/tinylink/links/shorten", json={"original_url": f"https://example.org/{args.seed}/{index}"}
+                )
+
+            results["redirect_cold"] = await run_requests(redirect, sample, args.concurrency, 307)
+            results["redirect_warm"] = await run_requests(
+                redirect, [random.choice(sample) for _ in range(args.requests)], args.concurrency, 307
+            )
+            results["shorten"] = await run_requests(shorten, range(args.shorten), args.concurrency, 200)
+            results["flush"] = await flush_clicks(visitor_sketches=not args.fake_redis)
+
+    return {
+        "run": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "links": args.links,
+            "requests": args.requests,
+            "shorten": args.shorten,
+            "concurrency": args.concurrency,
+            "redis": "fakeredis" if args.fake_redis else "redis-server",
+            "seed_seconds": round(seeded, 3),
+        },
+        "results": results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("BENCH_DATABASE_URL", "postgresql://postgres@localhost:5432/tinylink_bench"),
+    )
+    parser.add_argument(
+        "--redis-url", default=os.getenv("BENCH_REDIS_URL", "redis://localhost:6379/15"),
+        help='redis-server URL, or "fakeredis"',
+    )
+    parser.add_argument("--links", type=int, default=1000, help="links seeded, 1000 to 10000000")
+    parser.add_argument("--requests", type=int, default=5000, help="redirects per phase")
+    parser.add_argument("--shorten", type=int, default=1000, help="links shortened")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="JSON file, stdout if omitted")
+    args = parser.parse_args()
+
+    args.fake_redis = args.redis_url == "fakeredis"
+    if args.fake_redis:
+        args.redis_url = start_fake_redis()
+    configure_environment(args)
+    migrate()
+    report = asyncio.run(benchmark(args))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compares two benchmarks.app_throughput reports:
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+Prints the change of every metric and exits with 1 if a throughput dropped
+or a latency or duration grew by more than --threshold percent.
+"""
+import argparse
+import json
+import sys
+
+
+# Metrics where a higher value is better, the others are latencies and durations
+HIGHER_IS_BETTER = {"per_sec", "events_per_sec"}
+METRICS = ("per_sec", "p50_ms", "p99_ms", "events_per_sec")
+# Run parameters that have to match for the numbers to be comparable
+PARAMETERS = ("links", "requests", "shorten", "concurrency", "redis")
+
+
+def compare(before: dict, after: dict, threshold: float) -> list[str]:
+    regressions = []
+    for phase, metrics in after["results"].items():
+        baseline = before["results"].get(phase, {})
+        for metric in METRICS:
+            old, new = baseline.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = " REGRESSION" if worse > threshold else ""
+            print(f"{phase:15} {metric:15} {old:>12} -> {new:>12} {change:+7.1f}%{flag}")
+            if flag:
+                regressions.append(f"{phase}.{metric}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{before['run'].get('commit')} -> {after['run'].get('commit')}")
+    for parameter in PARAMETERS:
+        if before["run"].get(parameter) != after["run"].get(parameter):
+            print(f"warning: {parameter} differs, {before['run'].get(parameter)} -> {after['run'].get(parameter)}")
+    if compare(before, after, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
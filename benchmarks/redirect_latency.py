@@ -0,0 +1,112 @@
+"""
+Redirect cache-hit latency: sequential Redis commands vs the Lua script.
+
+Compares the old hot path (GET link, ZSCORE, ZINCRBY, SET last_used_at) with
+the single EVALSHA used by resolve_redirect and prints p50/p99 latency per
+redirect. The click stream it fills is deleted afterwards. Needs a running
+Redis, the difference is the network round-trips so run it against a server
+on another host/container:
+
+    python -m benchmarks.redirect_latency --redis-url redis://redis_app:6379/15
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime
+
+from redis import asyncio as aioredis
+
+from src.tinylink.bloom import BLOOM_KEY, BLOOM_READY_KEY
+from src.tinylink.cache import CachedLink, cache_link, negative_cache_key
+from src.tinylink.events import CLICK_STREAM
+from src.tinylink.scripts import REDIRECT_LUA
+
+
+async def sequential_redirect(redis_client: aioredis.Redis, short_code: str):
+    url = await redis_client.hget(f"link:{short_code}", "url")
+    if url:
+        await redis_client.zscore("usage_count", short_code)
+        await redis_client.zincrby("usage_count", 1, short_code)
+        await redis_client.set(f"last_used_at:{short_code}", datetime.utcnow().isoformat())
+    return url
+
+
+def make_script_redirect(redis_client: aioredis.Redis):
+    script = redis_client.register_script(REDIRECT_LUA)
+
+    async def script_redirect(redis_client: aioredis.Redis, short_code: str):
+        return await script(
+            keys=[f"link:{short_code}", CLICK_STREAM, negative_cache_key(short_code), BLOOM_KEY, BLOOM_READY_KEY],
+            args=[short_code, time.time(), "", "desktop", ""],
+            client=redis_client,
+        )
+
+    return script_redirect
+
+
+async def run(redirect, redis_client, codes, requests, concurrency):
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(random.choice(codes))
+
+    async def worker():
+        while not queue.empty():
+            short_code = queue.get_nowait()
+            started = time.perf_counter()
+            await redirect(redis_client, short_code)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "redirects_per_sec": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+    }
+
+
+async def main(args):
+    redis_client = aioredis.from_url(args.redis_url, decode_responses=True)
+    codes = [f"bench{i:06d}" for i in range(args.links)]
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for short_code in codes:
+            cache_link(pipe, short_code, CachedLink(f"https://example.com/{short_code}", None, True))
+            pipe.zadd("usage_count", {short_code: 0})
+        await pipe.execute()
+
+    results = {}
+    for name, redirect in (
+        ("sequential", sequential_redirect),
+        ("lua_script", make_script_redirect(redis_client)),
+    ):
+        # Warm-up so connection setup and SCRIPT LOAD are not measured
+        await run(redirect, redis_client, codes, args.concurrency * 10, args.concurrency)
+        results[name] = await run(redirect, redis_client, codes, args.requests, args.concurrency)
+
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for short_code in codes:
+            pipe.delete(f"link:{short_code}", f"last_used_at:{short_code}")
+            pipe.zrem("usage_count", short_code)
+        pipe.delete(CLICK_STREAM)
+        await pipe.execute()
+    await redis_client.aclose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--redis-url", default=os.getenv("BENCH_REDIS_URL", "redis://localhost:6379/15"))
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -3,6 +3,11 @@
 
 alembic upgrade head
 
+# Shared by the gunicorn workers for /metrics, emptied on every start
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+
 #cd src
 
 gunicorn src.main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=fastapi_app:8000
\ No newline at end of file
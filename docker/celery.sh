@@ -1,9 +1,14 @@
 #!/bin/bash
 
-cd src
-
 if [[ "${1}" == "celery" ]]; then
-  celery --app=tasks.tasks:celery worker -l INFO
+  # Metrics of the pool processes, served on METRICS_PORT by the main process
+  export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+  rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+  mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+  celery --app=src.tasks.celery_app:celery worker -Q "${CELERY_QUEUES:-maintenance,clicks}" \
+    --concurrency="${CELERY_CONCURRENCY:-2}" -l INFO
+elif [[ "${1}" == "beat" ]]; then
+  celery --app=src.tasks.celery_app:celery beat -s /tmp/celerybeat-schedule -l INFO
 elif [[ "${1}" == "flower" ]]; then
-  celery --app=tasks.tasks:celery flower
- fi
\ No newline at end of file
+  celery --app=src.tasks.celery_app:celery flower
+fi
@@ -0,0 +1,32 @@
+"""add link_click_rollups
+
+Revision ID: 4b9e1d7c3a58
+Revises: d2f6b8c41e73
+Create Date: 2026-10-18 22:03:17.582114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b9e1d7c3a58'
+down_revision: Union[str, None] = 'd2f6b8c41e73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'link_click_rollups',
+        sa.Column('rollup_id', sa.String(), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('rolled_up_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('rollup_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('link_click_rollups')
@@ -0,0 +1,52 @@
+"""add linkdata url_digest
+
+Revision ID: 5c5455967160
+Revises: 9918455e18eb
+Create Date: 2026-10-18 11:02:17.540921
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c5455967160'
+down_revision: Union[str, None] = '9918455e18eb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    op.add_column('linkdata', sa.Column('url_digest', sa.LargeBinary(16), nullable=True))
+
+    backfill = sa.text("""
+        UPDATE linkdata SET url_digest = decode(md5(original_url), 'hex')
+        WHERE id IN (
+            SELECT id FROM linkdata
+            WHERE url_digest IS NULL AND original_url IS NOT NULL
+            LIMIT :batch_size
+        )
+    """).bindparams(batch_size=BACKFILL_BATCH_SIZE)
+
+    # Backfill in short transactions so rows are never locked for long
+    with op.get_context().autocommit_block():
+        if op.get_context().as_sql:
+            op.execute("UPDATE linkdata SET url_digest = decode(md5(original_url), 'hex') WHERE original_url IS NOT NULL")
+        else:
+            while op.get_bind().execute(backfill).rowcount:
+                pass
+
+        op.create_index(
+            'ix_linkdata_active_url_digest', 'linkdata', ['url_digest'],
+            postgresql_where=sa.text('is_active'), postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_linkdata_active_url_digest', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
+    op.drop_column('linkdata', 'url_digest')
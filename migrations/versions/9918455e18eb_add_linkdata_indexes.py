@@ -0,0 +1,119 @@
+"""add linkdata indexes
+
+Revision ID: 9918455e18eb
+Revises: 3ccd72ee027d
+Create Date: 2026-10-18 10:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9918455e18eb'
+down_revision: Union[str, None] = '3ccd72ee027d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    duplicates = None
+    if not op.get_context().as_sql:
+        duplicates = op.get_bind().execute(sa.text(
+            "SELECT lower(short_code) FROM linkdata GROUP BY lower(short_code) HAVING count(*) > 1 LIMIT 10"
+        )).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            f"linkdata has short codes that differ only in case: {duplicates}. "
+            "Resolve them before creating the unique index on lower(short_code)."
+        )
+
+    # Built without locking out writes on a live table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_linkdata_short_code_lower', 'linkdata', [sa.text('lower(short_code)')],
+            unique=True, postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_linkdata_user_id', 'linkdata', ['user_id'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_linkdata_active_expires_at', 'linkdata', ['expires_at'],
+            postgresql_where=sa.text('is_active'), postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_linkdata_active_last_used_at', 'linkdata', ['last_used_at'],
+            postgresql_where=sa.text('is_active'), postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_linkdata_active_unused_created', 'linkdata', ['created'],
+            postgresql_where=sa.text('is_active AND last_used_at IS NULL'),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+    # Probe the unique index instead of scanning linkdata on every attempt,
+    # and treat codes that differ only in case as taken
+    op.execute("""
+        CREATE OR REPLACE FUNCTION public.generate_unique_short_code(
+            length integer DEFAULT 6)
+            RETURNS text
+            LANGUAGE 'plpgsql'
+            COST 100
+            VOLATILE PARALLEL UNSAFE
+        AS $BODY$
+        DECLARE
+            characters TEXT := 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789';
+            generated_code TEXT;
+        BEGIN
+            LOOP
+                generated_code := '';
+                FOR i IN 1..length LOOP
+                    generated_code := generated_code || substr(characters, ceil(random() * length(characters))::integer, 1);
+                END LOOP;
+
+                PERFORM 1 FROM linkdata WHERE lower(linkdata.short_code) = lower(generated_code);
+                IF NOT FOUND THEN
+                    RETURN generated_code;
+                END IF;
+            END LOOP;
+        END;
+        $BODY$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("""
+        CREATE OR REPLACE FUNCTION public.generate_unique_short_code(
+            length integer DEFAULT 6)
+            RETURNS text
+            LANGUAGE 'plpgsql'
+            COST 100
+            VOLATILE PARALLEL UNSAFE
+        AS $BODY$
+        DECLARE
+            characters TEXT := 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789';
+            generated_code TEXT;
+        BEGIN
+            LOOP
+                generated_code := '';
+                FOR i IN 1..length LOOP
+                    generated_code := generated_code || substr(characters, ceil(random() * length(characters))::integer, 1);
+                END LOOP;
+
+                PERFORM 1 FROM linkdata WHERE linkdata.short_code = generated_code;
+                IF NOT FOUND THEN
+                    RETURN generated_code;
+                END IF;
+            END LOOP;
+        END;
+        $BODY$;
+    """)
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_linkdata_active_unused_created', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_linkdata_active_last_used_at', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_linkdata_active_expires_at', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_linkdata_user_id', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_linkdata_short_code_lower', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,48 @@
+"""add linkdata keyset indexes
+
+Revision ID: a3c91f5e7b08
+Revises: f8a03c6e5d21
+Create Date: 2026-10-18 16:42:09.514870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c91f5e7b08'
+down_revision: Union[str, None] = 'f8a03c6e5d21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The new indexes cover the single-column ones they replace, which are
+    # dropped once the new ones are built
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_linkdata_user_id_created', 'linkdata', ['user_id', 'created', 'id'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_linkdata_active_expires_at_id', 'linkdata', ['expires_at', 'id'],
+            postgresql_where=sa.text('is_active'), postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.drop_index('ix_linkdata_active_expires_at', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_linkdata_user_id', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_linkdata_user_id', 'linkdata', ['user_id'],
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_linkdata_active_expires_at', 'linkdata', ['expires_at'],
+            postgresql_where=sa.text('is_active'), postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.drop_index('ix_linkdata_active_expires_at_id', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_linkdata_user_id_created', table_name='linkdata', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,41 @@
+"""add short code sequences
+
+Revision ID: b7e2d4a91c3f
+Revises: 5c5455967160
+Create Date: 2026-10-18 12:20:44.306182
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d4a91c3f'
+down_revision: Union[str, None] = '5c5455967160'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# IDs reserved by a worker per nextval()
+CODE_BLOCK_SIZE = 1000
+REGISTERED_CODE_IDS = 36 ** 6
+ANONYMOUS_CODE_IDS = 36 ** 10
+
+
+def upgrade() -> None:
+    # Registered users take IDs [0, 36^6), anonymous links [36^6, 36^10), so an
+    # ID alone tells which kind of link it belongs to
+    op.execute(sa.schema.CreateSequence(sa.Sequence(
+        'short_code_registered_seq', start=0, minvalue=0, maxvalue=REGISTERED_CODE_IDS - 1,
+        increment=CODE_BLOCK_SIZE,
+    )))
+    op.execute(sa.schema.CreateSequence(sa.Sequence(
+        'short_code_anonymous_seq', start=REGISTERED_CODE_IDS, minvalue=REGISTERED_CODE_IDS,
+        maxvalue=ANONYMOUS_CODE_IDS - 1, increment=CODE_BLOCK_SIZE,
+    )))
+
+
+def downgrade() -> None:
+    op.execute(sa.schema.DropSequence(sa.Sequence('short_code_anonymous_seq')))
+    op.execute(sa.schema.DropSequence(sa.Sequence('short_code_registered_seq')))
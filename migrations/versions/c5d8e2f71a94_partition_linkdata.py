@@ -0,0 +1,178 @@
+"""partition linkdata
+
+Revision ID: c5d8e2f71a94
+Revises: a3c91f5e7b08
+Create Date: 2026-10-18 18:20:37.602914
+
+"""
+from typing import Optional, Sequence, Union
+import hashlib
+import os
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d8e2f71a94'
+down_revision: Union[str, None] = 'a3c91f5e7b08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COPY_BATCH_SIZE = 10000
+COLUMNS = "id, user_id, original_url, short_code, created, expires_at, usage_count, last_used_at, is_active, url_digest"
+
+# The short code scheme and partition layout as of this revision
+# (src/tinylink/codes.py, src/tinylink/partitions.py), frozen so that later
+# changes there do not change what this migration does. The key and the
+# partition size are deployment settings, read like src/config.py does.
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+FEISTEL_ROUNDS = 4
+ANONYMOUS_ID_START = len(ALPHABET) ** 6
+ANONYMOUS_ID_END = len(ALPHABET) ** 10
+ANONYMOUS_PARTITION_IDS = int(os.getenv("ANONYMOUS_PARTITION_IDS", 10_000_000))
+PARTITIONS_AHEAD = 2
+SHORT_CODE_KEY = os.getenv("SHORT_CODE_KEY", "tinylink")
+
+
+def decode(short_code: str) -> Optional[int]:
+    """
+    The ID a 6- or 10-character code was generated from (CodePermutation.decode).
+    """
+    length = len(short_code)
+    if length not in (6, 10) or any(char not in ALPHABET for char in short_code):
+        return None
+    domain = len(ALPHABET) ** length
+    half_bits = ((domain - 1).bit_length() + 1) // 2
+    half_mask = (1 << half_bits) - 1
+    key = hashlib.blake2b(f"{SHORT_CODE_KEY}:{length}".encode(), digest_size=32).digest()
+
+    def unpermute(value: int) -> int:
+        left, right = value >> half_bits, value & half_mask
+        for i in reversed(range(FEISTEL_ROUNDS)):
+            digest = hashlib.blake2b(left.to_bytes(8, "little") + bytes([i]), key=key, digest_size=8).digest()
+            left, right = right ^ (int.from_bytes(digest, "little") & half_mask), left
+        return (left << half_bits) | right
+
+    value = 0
+    for char in short_code:
+        value = value * len(ALPHABET) + ALPHABET.index(char)
+    value = unpermute(value)
+    while value >= domain:
+        value = unpermute(value)
+    return value
+
+
+def code_id_of(short_code: str) -> int:
+    short_code = short_code.lower()
+    code_id = decode(short_code)
+    if code_id is not None and (len(short_code) == 6) == (code_id < ANONYMOUS_ID_START):
+        return code_id
+    digest = hashlib.blake2b(short_code.encode(), digest_size=8).digest()
+    return -1 - (int.from_bytes(digest, "little") >> 1)
+
+
+def create_linkdata_indexes(table: str, unique_short_code: bool) -> None:
+    if unique_short_code:
+        op.create_index('ix_linkdata_short_code_lower', table, [sa.text('lower(short_code)')], unique=True)
+    op.create_index('ix_linkdata_user_id_created', table, ['user_id', 'created', 'id'])
+    op.create_index('ix_linkdata_active_expires_at_id', table, ['expires_at', 'id'], postgresql_where=sa.text('is_active'))
+    op.create_index('ix_linkdata_active_last_used_at', table, ['last_used_at'], postgresql_where=sa.text('is_active'))
+    op.create_index('ix_linkdata_active_url_digest', table, ['url_digest'], postgresql_where=sa.text('is_active'))
+    op.create_index(
+        'ix_linkdata_active_unused_created', table, ['created'],
+        postgresql_where=sa.text('is_active AND last_used_at IS NULL'),
+    )
+
+
+def linkdata_columns(*extra: sa.Column) -> list:
+    return [
+        *extra,
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('user_id', sa.UUID(), nullable=True),
+        sa.Column('original_url', sa.String(), nullable=True),
+        sa.Column('short_code', sa.String(), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('usage_count', sa.Integer(), nullable=False),
+        sa.Column('last_used_at', sa.DateTime(), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('url_digest', sa.LargeBinary(length=16), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    if op.get_context().as_sql:
+        raise RuntimeError("code_id is computed in Python, run this migration online")
+    bind = op.get_bind()
+
+    # Reads keep working, writes wait until the copy is committed
+    op.execute("LOCK TABLE linkdata IN SHARE ROW EXCLUSIVE MODE")
+
+    op.create_table(
+        'linkdata_partitioned',
+        *linkdata_columns(sa.Column('code_id', sa.BigInteger(), autoincrement=False, nullable=False)),
+        sa.PrimaryKeyConstraint('code_id', name='linkdata_partitioned_pkey'),
+        postgresql_partition_by='RANGE (code_id)',
+    )
+    op.execute("CREATE TABLE linkdata_aliases PARTITION OF linkdata_partitioned FOR VALUES FROM (MINVALUE) TO (0)")
+    op.execute(
+        f"CREATE TABLE linkdata_registered PARTITION OF linkdata_partitioned "
+        f"FOR VALUES FROM (0) TO ({ANONYMOUS_ID_START})"
+    )
+    position = bind.execute(sa.text(
+        "SELECT last_value FROM pg_sequences "
+        "WHERE schemaname = current_schema() AND sequencename = 'short_code_anonymous_seq'"
+    )).scalar() or ANONYMOUS_ID_START
+    current = (position - ANONYMOUS_ID_START) // ANONYMOUS_PARTITION_IDS
+    for index in range(current, current + PARTITIONS_AHEAD + 1):
+        start = ANONYMOUS_ID_START + index * ANONYMOUS_PARTITION_IDS
+        end = min(start + ANONYMOUS_PARTITION_IDS, ANONYMOUS_ID_END)
+        op.execute(
+            f"CREATE TABLE linkdata_anonymous_p{index:06d} PARTITION OF linkdata_partitioned "
+            f"FOR VALUES FROM ({start}) TO ({end})"
+        )
+    op.execute("CREATE TABLE linkdata_default PARTITION OF linkdata_partitioned DEFAULT")
+
+    copy = sa.text(
+        f"INSERT INTO linkdata_partitioned (code_id, {COLUMNS}) "
+        f"SELECT codes.code_id, {', '.join('linkdata.' + name for name in COLUMNS.split(', '))} FROM linkdata "
+        f"JOIN unnest(CAST(:ids AS uuid[]), CAST(:code_ids AS bigint[])) AS codes (id, code_id) "
+        f"ON linkdata.id = codes.id"
+    )
+    batch = sa.text(
+        "SELECT id, short_code FROM linkdata WHERE id > CAST(:last_id AS uuid) ORDER BY id LIMIT :limit"
+    )
+    last_id = uuid.UUID(int=0)
+    while True:
+        rows = bind.execute(batch, {"last_id": last_id, "limit": COPY_BATCH_SIZE}).fetchall()
+        if not rows:
+            break
+        # Rows without a code keep a unique key through their id
+        bind.execute(copy, {
+            "ids": [row.id for row in rows],
+            "code_ids": [code_id_of(row.short_code or str(row.id)) for row in rows],
+        })
+        last_id = rows[-1].id
+
+    op.drop_table('linkdata')
+    op.rename_table('linkdata_partitioned', 'linkdata')
+    op.execute("ALTER TABLE linkdata RENAME CONSTRAINT linkdata_partitioned_pkey TO linkdata_pkey")
+    # Lookups go through the code_id primary key, lower(short_code) has no index
+    create_linkdata_indexes('linkdata', unique_short_code=False)
+
+
+def downgrade() -> None:
+    op.execute("LOCK TABLE linkdata IN SHARE ROW EXCLUSIVE MODE")
+    op.create_table(
+        'linkdata_unpartitioned',
+        *linkdata_columns(),
+        sa.PrimaryKeyConstraint('id', name='linkdata_unpartitioned_pkey'),
+    )
+    op.execute(f"INSERT INTO linkdata_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM linkdata")
+    # Drops the partitions as well
+    op.drop_table('linkdata')
+    op.rename_table('linkdata_unpartitioned', 'linkdata')
+    op.execute("ALTER TABLE linkdata RENAME CONSTRAINT linkdata_unpartitioned_pkey TO linkdata_pkey")
+    create_linkdata_indexes('linkdata', unique_short_code=True)
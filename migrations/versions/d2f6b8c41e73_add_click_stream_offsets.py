@@ -0,0 +1,32 @@
+"""add click_stream_offsets
+
+Revision ID: d2f6b8c41e73
+Revises: c5d8e2f71a94
+Create Date: 2026-10-18 21:14:52.308416
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f6b8c41e73'
+down_revision: Union[str, None] = 'c5d8e2f71a94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'click_stream_offsets',
+        sa.Column('consumer', sa.String(), nullable=False),
+        sa.Column('last_id', sa.String(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('consumer'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('click_stream_offsets')
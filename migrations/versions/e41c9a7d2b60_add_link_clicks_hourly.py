@@ -0,0 +1,35 @@
+"""add link_clicks_hourly
+
+Revision ID: e41c9a7d2b60
+Revises: b7e2d4a91c3f
+Create Date: 2026-10-18 14:05:12.771530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41c9a7d2b60'
+down_revision: Union[str, None] = 'b7e2d4a91c3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Monthly partitions are created by the click rollup as needed
+    op.create_table(
+        'link_clicks_hourly',
+        sa.Column('short_code', sa.String(), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('clicks', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('short_code', 'bucket'),
+        postgresql_partition_by='RANGE (bucket)',
+    )
+
+
+def downgrade() -> None:
+    # Drops the partitions as well
+    op.drop_table('link_clicks_hourly')
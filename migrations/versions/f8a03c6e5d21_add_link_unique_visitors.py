@@ -0,0 +1,37 @@
+"""add link_unique_visitors
+
+Revision ID: f8a03c6e5d21
+Revises: e41c9a7d2b60
+Create Date: 2026-10-18 15:31:48.092113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f8a03c6e5d21'
+down_revision: Union[str, None] = 'e41c9a7d2b60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'link_unique_visitors',
+        sa.Column('short_code', sa.String(), nullable=False),
+        sa.Column('period', sa.String(length=5), nullable=False),
+        sa.Column('period_start', sa.Date(), nullable=False),
+        sa.Column('sketch', sa.LargeBinary(), nullable=False),
+        sa.Column('estimate', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('short_code', 'period', 'period_start'),
+    )
+    op.create_index('ix_link_unique_visitors_period_start', 'link_unique_visitors', ['period_start'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_link_unique_visitors_period_start', table_name='link_unique_visitors')
+    op.drop_table('link_unique_visitors')
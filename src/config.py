@@ -14,3 +14,59 @@ SMTP_USER = os.getenv("SMTP_USER")
 SECRET =  os.getenv("SECRET")
 DEACTIVATION_DAYS = os.getenv("DEACTIVATION_DAYS")
 ALGORITHM = os.getenv("ALGORITHM")
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis_app:6379/0")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 2))
+
+L1_CACHE_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", 10000))
+L1_CACHE_TTL = float(os.getenv("L1_CACHE_TTL", 300))
+LINK_CACHE_TTL = int(os.getenv("LINK_CACHE_TTL", 3600))
+
+NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", 60))
+BLOOM_CAPACITY = int(os.getenv("BLOOM_CAPACITY", 10_000_000))
+BLOOM_ERROR_RATE = float(os.getenv("BLOOM_ERROR_RATE", 0.001))
+BLOOM_REBUILD_INTERVAL = int(os.getenv("BLOOM_REBUILD_INTERVAL", 24 * 60 * 60))
+# Cross-worker lock held while one request loads a missed link, 0 disables it
+LINK_LOAD_LOCK_MS = int(os.getenv("LINK_LOAD_LOCK_MS", 250))
+
+# Key of the permutation that turns allocated IDs into short codes. Changing it
+# on a live deployment makes new codes collide with existing ones.
+SHORT_CODE_KEY = os.getenv("SHORT_CODE_KEY", "tinylink")
+
+# Click events stream, consumed by the aggregator (python -m src.tasks.aggregator)
+CLICK_BATCH_SIZE = int(os.getenv("CLICK_BATCH_SIZE", 1000))
+CLICK_BLOCK_MS = int(os.getenv("CLICK_BLOCK_MS", 1000))
+# Pending events of a consumer idle this long are claimed by another one
+CLICK_CLAIM_IDLE_MS = int(os.getenv("CLICK_CLAIM_IDLE_MS", 60_000))
+# Consumers with nothing pending, idle this long, are removed with their offset
+CLICK_CONSUMER_EXPIRY_MS = int(os.getenv("CLICK_CONSUMER_EXPIRY_MS", 86_400_000))
+# Hourly click buckets: rolled up from Redis into link_clicks_hourly
+CLICK_ROLLUP_INTERVAL = int(os.getenv("CLICK_ROLLUP_INTERVAL", 300))
+CLICK_BUCKET_RETENTION_DAYS = int(os.getenv("CLICK_BUCKET_RETENTION_DAYS", 400))
+# Key for hashing visitor fingerprints (client IP and user agent)
+VISITOR_HASH_KEY = os.getenv("VISITOR_HASH_KEY", SECRET or "tinylink")
+# Top links leaderboard responses are cached this long, per worker and in Redis
+TOP_LINKS_CACHE_TTL = int(os.getenv("TOP_LINKS_CACHE_TTL", 10))
+# Link deactivation, run by one worker at a time (src/tasks/maintenance.py)
+MAINTENANCE_INTERVAL = int(os.getenv("MAINTENANCE_INTERVAL", 24 * 60 * 60))
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", 1000))
+# Celery worker and beat (src/tasks/celery_app.py)
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", REDIS_URL)
+LINK_EXPIRY_INTERVAL = int(os.getenv("LINK_EXPIRY_INTERVAL", 60 * 60))
+# Anonymous link IDs per linkdata partition (src/tinylink/partitions.py)
+ANONYMOUS_PARTITION_IDS = int(os.getenv("ANONYMOUS_PARTITION_IDS", 10_000_000))
+# Links preloaded into Redis once per deployed version (src/tinylink/warmup.py)
+WARMUP_LINKS = int(os.getenv("WARMUP_LINKS", 10000))
+# Port of the metrics exposition of the aggregator and the Celery worker,
+# 0 disables it. The web workers serve /metrics.
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# Request profiling (src/profiling.py): fraction of requests profiled,
+# profiled requests slower than PROFILE_SLOW_MS are kept in the last
+# PROFILE_BUFFER_SIZE. PROFILE_KEY signs X-Profile tokens that profile a
+# request regardless of the rate, empty disables them.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", 250))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", 200))
+PROFILE_KEY = os.getenv("PROFILE_KEY", "")
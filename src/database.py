@@ -1,6 +1,7 @@
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from src.config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from src.metrics import instrument_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
 
@@ -8,6 +9,7 @@ from sqlalchemy import create_engine
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
 engine = create_async_engine(DATABASE_URL)
+instrument_engine(engine)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
 
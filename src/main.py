@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Response
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
 from src.auth.users import auth_backend, current_active_user, fastapi_users
@@ -6,26 +6,72 @@ from src.auth.schemas import UserCreate, UserRead #, UserUpdate
 from src.auth.db import User, create_db_and_tables
 from src.tinylink.router import router as tinylink_router
 from src.tasks.tasks import router as tasks_router
+from src.redis_client import init_redis_pool, close_redis_pool, get_redis_client
+from src.tinylink.scripts import register_scripts
+from src.tinylink.invalidation import start_invalidation_listener, stop_invalidation_listener
+from src.tinylink.bloom import periodic_bloom_rebuild
+from src.tinylink.warmup import warm_up
+from src.tinylink.codes import code_allocators
+from src.tinylink.partitions import PartitionsAhead
+from src.tinylink.fastpath import RedirectFastPath
+from src.metrics import MetricsMiddleware, render_metrics, track_task
+from src.profiling import ProfilingMiddleware, router as profiling_router
+from src.database import async_session_maker
+from src.config import REDIS_URL
 from redis import asyncio as aioredis
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from typing import Optional
 
+import asyncio
+import logging
 import uvicorn
 
 
+FASTAPI_CACHE_PREFIX = "fastapi-cache"
+
+logger = logging.getLogger(__name__)
+
+
 @asynccontextmanager
 async def lifespan(_: FastAPI) -> AsyncIterator[None]:
-    redis = aioredis.from_url("redis://redis_app")
-
-    # Очистка кэша Redis при запуске приложения
-    await redis.flushdb()
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
-    # await create_db_and_tables()
-    yield
+    # Shared pool for the link router and background tasks (see src/redis_client.py)
+    init_redis_pool()
+    redis = aioredis.from_url(REDIS_URL)
+    bloom_task = None
+    # A failed startup still stops the listener and closes the pools
+    try:
+        await register_scripts(get_redis_client())
+        start_invalidation_listener()
+        FastAPICache.init(RedisBackend(redis), prefix=FASTAPI_CACHE_PREFIX)
+        # Redis data is kept across restarts, the first worker of a version
+        # clears the cached responses and preloads the most used links
+        try:
+            with track_task("warm_up"):
+                await warm_up(async_session_maker, get_redis_client(), VERSION, FASTAPI_CACHE_PREFIX)
+        except Exception:
+            # Cold caches only cost database reads, the worker serves anyway
+            logger.exception("Cache warm-up failed, starting with cold caches")
+        # await create_db_and_tables()
+        bloom_task = asyncio.create_task(periodic_bloom_rebuild(async_session_maker, get_redis_client()))
+        # Anonymous partitions are created as the sequence approaches them
+        code_allocators[10].on_block = PartitionsAhead(async_session_maker)
+        yield
+    finally:
+        if bloom_task is not None:
+            bloom_task.cancel()
+        await stop_invalidation_listener()
+        await redis.aclose()
+        await close_redis_pool()
 
 VERSION='1.0.1'
 app = FastAPI(lifespan=lifespan, title="TinyLink API", version=VERSION)
+# Redirects are answered before routing, see src/tinylink/fastpath.py
+app.add_middleware(RedirectFastPath)
+# Sampled and X-Profile requests, including fast path redirects (src/profiling.py)
+app.add_middleware(ProfilingMiddleware)
+# Outermost, so that fast path redirects are timed too
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(
     fastapi_users.get_auth_router(auth_backend), prefix="/auth/jwt", tags=["auth"]
@@ -38,6 +84,14 @@ app.include_router(
 
 app.include_router(tinylink_router)
 app.include_router(tasks_router)
+app.include_router(profiling_router)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Sync: reading the per-worker files of the multiprocess mode blocks
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 
 @app.get("/protected-route")
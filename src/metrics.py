@@ -0,0 +1,197 @@
+"""
+Prometheus metrics. With PROMETHEUS_MULTIPROC_DIR set (docker/app.sh) every
+gunicorn worker writes its samples to that directory and /metrics on any
+worker reports the sum over all of them. The aggregator and the Celery
+worker run elsewhere and serve their own on METRICS_PORT.
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server,
+)
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+# Redirects are served in about a millisecond from the caches
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+BATCH_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+STATEMENT_TYPES = ("select", "insert", "update", "delete")
+# Statements kept per profiled request, the counts and totals cover all of them
+PROFILE_MAX_QUERIES = 100
+PROFILE_STATEMENT_LENGTH = 500
+
+HTTP_REQUEST_DURATION = Histogram(
+    "tinylink_http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "tinylink_redis_command_duration_seconds", "Redis round-trips by command, pipelines count once",
+    ["command"], buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_DURATION = Histogram(
+    "tinylink_db_query_duration_seconds", "PostgreSQL statements by type",
+    ["statement"], buckets=LATENCY_BUCKETS,
+)
+# l1_hit, redis_hit, rejected (negative cache or bloom filter), miss (database)
+REDIRECT_LOOKUPS = Counter("tinylink_redirect_lookups", "Redirect lookups by the cache level that answered", ["result"])
+CLICK_BATCH_EVENTS = Histogram(
+    "tinylink_click_batch_size", "Click events applied per aggregator batch", buckets=BATCH_BUCKETS,
+)
+BACKGROUND_TASK_DURATION = Histogram(
+    "tinylink_background_task_duration_seconds", "Background task runs", ["task", "outcome"], buckets=TASK_BUCKETS,
+)
+INVALIDATION_LAG = Histogram(
+    "tinylink_invalidation_lag_seconds", "Link invalidation bus delay from publish to receipt", buckets=LATENCY_BUCKETS,
+)
+
+
+class RequestProfile:
+    __slots__ = ("queries", "query_count", "query_seconds", "redis_round_trips", "redis_seconds")
+
+    def __init__(self):
+        self.queries = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.redis_round_trips = 0
+        self.redis_seconds = 0.0
+
+    def add_query(self, statement: str, seconds: float) -> None:
+        self.query_count += 1
+        self.query_seconds += seconds
+        if len(self.queries) < PROFILE_MAX_QUERIES:
+            self.queries.append({"statement": statement[:PROFILE_STATEMENT_LENGTH], "ms": round(seconds * 1000, 3)})
+
+    def add_redis(self, seconds: float) -> None:
+        self.redis_round_trips += 1
+        self.redis_seconds += seconds
+
+
+# Set for the duration of a request profiled by src/profiling.py, None otherwise
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+def metrics_registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> tuple[bytes, str]:
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def serve_metrics(port: int) -> None:
+    """
+    Exposition on its own port for processes without an HTTP app.
+    """
+    start_http_server(port, registry=metrics_registry())
+
+
+@contextmanager
+def track_task(task: str) -> Iterator[None]:
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        BACKGROUND_TASK_DURATION.labels(task, outcome).observe(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request, labelled with the route template so that
+    /tinylink/link/{short_code} is one series. Requests no route matched are
+    labelled "unmatched".
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(scope["method"], route, status).observe(time.perf_counter() - started)
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            elapsed = time.perf_counter() - started
+            REDIS_COMMAND_DURATION.labels("multi" if self.is_transaction else "pipeline").observe(elapsed)
+            profile = current_profile.get()
+            if profile is not None:
+                profile.add_redis(elapsed)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """
+    Times every command sent to Redis; Lua scripts show up as evalsha.
+    """
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            elapsed = time.perf_counter() - started
+            REDIS_COMMAND_DURATION.labels(str(args[0]).lower()).observe(elapsed)
+            profile = current_profile.get()
+            if profile is not None:
+                profile.add_redis(elapsed)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+def statement_type(statement: str) -> str:
+    keyword = statement.lstrip()[:6].lower()
+    return keyword if keyword in STATEMENT_TYPES else "other"
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Times the statements of an engine through its cursor events.
+    """
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is not None:
+            elapsed = time.perf_counter() - started
+            DB_QUERY_DURATION.labels(statement_type(statement)).observe(elapsed)
+            profile = current_profile.get()
+            if profile is not None:
+                profile.add_query(statement, elapsed)
@@ -0,0 +1,156 @@
+"""
+Opt-in request profiling. ProfilingMiddleware profiles PROFILE_SAMPLE_RATE
+of the requests, and any request carrying a valid X-Profile token. A
+profiled request collects, through the Redis and SQLAlchemy hooks of
+src/metrics.py, the statements it ran with their timings and its Redis
+round-trips. The ones slower than PROFILE_SLOW_MS (token requests always)
+are logged and kept in a Redis list of the last PROFILE_BUFFER_SIZE,
+shared by the workers and read at GET /admin/profiles.
+
+A token is "{expires}.{hmac}" signed with PROFILE_KEY:
+
+    python -m src.profiling token 3600
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from redis import asyncio as aioredis
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.auth.db import User
+from src.auth.users import current_active_user
+from src.config import PROFILE_BUFFER_SIZE, PROFILE_KEY, PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS
+from src.metrics import RequestProfile, current_profile
+from src.redis_client import get_redis, get_redis_client
+
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_BUFFER_KEY = "profiles:slow"
+
+logger = logging.getLogger(__name__)
+
+
+def profile_token(ttl: int, now: Optional[float] = None) -> str:
+    expires = str(int((now or time.time()) + ttl))
+    return f"{expires}.{hmac.new(PROFILE_KEY.encode(), expires.encode(), hashlib.sha256).hexdigest()}"
+
+
+def valid_profile_token(token: str, now: float) -> bool:
+    if not PROFILE_KEY:
+        return False
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < now:
+        return False
+    expected = hmac.new(PROFILE_KEY.encode(), expires.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+
+def header_value(raw_headers: list, name: bytes) -> Optional[str]:
+    for key, value in raw_headers:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        token = header_value(scope["headers"], PROFILE_HEADER) if PROFILE_KEY else None
+        forced = token is not None and valid_profile_token(token, time.time())
+        if not forced and (not PROFILE_SAMPLE_RATE or random.random() >= PROFILE_SAMPLE_RATE):
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        reset = current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_profile.reset(reset)
+            seconds = time.perf_counter() - started
+            if forced or seconds * 1000 >= PROFILE_SLOW_MS:
+                await record_profile(scope, status, seconds, profile, forced)
+
+
+async def record_profile(scope: Scope, status: int, seconds: float, profile: RequestProfile, forced: bool) -> None:
+    io_seconds = profile.query_seconds + profile.redis_seconds
+    entry = {
+        "at": datetime.utcnow().isoformat(timespec="milliseconds"),
+        "worker": os.getpid(),
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": getattr(scope.get("route"), "path", None),
+        "status": status,
+        "forced": forced,
+        "ms": round(seconds * 1000, 3),
+        # Time awaiting the database and Redis, the rest is spent in Python
+        # or waiting for the event loop
+        "io_ms": round(io_seconds * 1000, 3),
+        "redis_round_trips": profile.redis_round_trips,
+        "redis_ms": round(profile.redis_seconds * 1000, 3),
+        "query_count": profile.query_count,
+        "query_ms": round(profile.query_seconds * 1000, 3),
+        "queries": profile.queries,
+    }
+    logger.warning(
+        "Profiled %s %s: %s in %.1fms, %.1fms I/O, %s queries, %s Redis round-trips",
+        entry["method"], entry["path"], status, entry["ms"], entry["io_ms"],
+        profile.query_count, profile.redis_round_trips,
+    )
+    try:
+        async with get_redis_client().pipeline(transaction=False) as pipe:
+            pipe.lpush(PROFILE_BUFFER_KEY, json.dumps(entry))
+            pipe.ltrim(PROFILE_BUFFER_KEY, 0, PROFILE_BUFFER_SIZE - 1)
+            await pipe.execute()
+    except Exception:
+        # The response has been sent, losing the profile is all that happens
+        logger.exception("Could not store the request profile")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/profiles")
+async def get_profiles(
+    limit: int = Query(50, ge=1, le=1000),
+    user: Optional[User] = Depends(current_active_user),
+    redis_client: aioredis.Redis = Depends(get_redis),
+):
+    """
+    The most recent slow or token-profiled requests, newest first.
+    """
+    if user is None or not user.is_superuser:
+        raise HTTPException(status_code=403, detail="Only superusers can read request profiles")
+    entries = await redis_client.lrange(PROFILE_BUFFER_KEY, 0, limit - 1)
+    return {
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "slow_ms": PROFILE_SLOW_MS,
+        "profiles": [json.loads(entry) for entry in entries],
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "token" or not PROFILE_KEY:
+        sys.exit("usage: PROFILE_KEY=... python -m src.profiling token [ttl seconds]")
+    print(profile_token(int(sys.argv[2]) if len(sys.argv) > 2 else 3600))
@@ -0,0 +1,70 @@
+from typing import AsyncGenerator, Optional
+
+from redis import asyncio as aioredis
+
+from src.config import REDIS_URL, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, REDIS_SOCKET_TIMEOUT
+from src.metrics import InstrumentedRedis
+
+
+# Shared per-process pool, created in the FastAPI lifespan (src/main.py)
+redis_pool: Optional[aioredis.BlockingConnectionPool] = None
+# Pool without response decoding for binary values, created on first use
+raw_redis_pool: Optional[aioredis.BlockingConnectionPool] = None
+
+
+def init_redis_pool() -> aioredis.BlockingConnectionPool:
+    """
+    Creates the process-wide asyncio Redis connection pool.
+
+    A blocking pool makes callers wait up to REDIS_POOL_TIMEOUT for a free
+    connection instead of failing once REDIS_MAX_CONNECTIONS are checked out.
+    """
+    global redis_pool
+    redis_pool = aioredis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        health_check_interval=30,
+        decode_responses=True,
+    )
+    return redis_pool
+
+
+async def close_redis_pool() -> None:
+    global redis_pool, raw_redis_pool
+    if redis_pool is not None:
+        await redis_pool.disconnect()
+        redis_pool = None
+    if raw_redis_pool is not None:
+        await raw_redis_pool.disconnect()
+        raw_redis_pool = None
+
+
+def get_redis_client() -> aioredis.Redis:
+    """
+    Returns a client bound to the shared pool (for background tasks).
+    """
+    if redis_pool is None:
+        raise RuntimeError("Redis pool is not initialised, it is created in the app lifespan")
+    return InstrumentedRedis(connection_pool=redis_pool)
+
+
+def get_raw_redis_client() -> aioredis.Redis:
+    """
+    Returns a client that leaves values as bytes (HyperLogLog sketches).
+    """
+    global raw_redis_pool
+    if raw_redis_pool is None:
+        raw_redis_pool = aioredis.BlockingConnectionPool.from_url(
+            REDIS_URL,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30,
+        )
+    return InstrumentedRedis(connection_pool=raw_redis_pool)
+
+
+async def get_redis() -> AsyncGenerator[aioredis.Redis, None]:
+    yield get_redis_client()
@@ -0,0 +1,288 @@
+"""
+Click aggregator, runs as its own process next to the web workers:
+
+    python -m src.tasks.aggregator
+
+Consumes the click stream in the CLICK_GROUP consumer group and writes the
+aggregated counters to linkdata and to hourly buckets, visitor sketches and
+top links slots in Redis. Buckets and sketches are persisted to
+link_clicks_hourly and link_unique_visitors by the flush_click_counters
+Celery task (src/tasks/celery_app.py). Any number of aggregators can run, Redis
+spreads the events across them. Events are acknowledged after the database
+commit; events left pending by a crashed consumer are claimed by another one
+after CLICK_CLAIM_IDLE_MS. The linkdata UPDATE commits the last stream ID it
+applied for the consumer in click_stream_offsets, a batch replayed after a
+crash between the commit and the acknowledgement skips the entries at or
+below it, so every click is counted in linkdata exactly once.
+
+The stream is trimmed up to the group's oldest pending entry, never past an
+event that has not been applied.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+
+from redis import asyncio as aioredis
+from redis.exceptions import ResponseError
+from sqlalchemy import BigInteger, DateTime, Integer, String, column, delete, func, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.config import CLICK_BATCH_SIZE, CLICK_BLOCK_MS, CLICK_CLAIM_IDLE_MS, CLICK_CONSUMER_EXPIRY_MS, METRICS_PORT
+from src.database import async_session_maker
+from src.metrics import CLICK_BATCH_EVENTS, serve_metrics, track_task
+from src.redis_client import close_redis_pool, get_redis_client, init_redis_pool
+from src.tinylink.analytics import count_hourly_clicks, hour_of
+from src.tinylink.codes import code_id_of
+from src.tinylink.events import CLICK_GROUP, CLICK_STREAM
+from src.tinylink.leaderboard import count_top_clicks, top_slot_of
+from src.tinylink.models import click_stream_offsets, linkdata
+from src.tinylink.visitors import add_visitors, visitor_windows
+
+
+logger = logging.getLogger(__name__)
+
+
+async def ensure_consumer_group(redis_client: aioredis.Redis) -> None:
+    try:
+        await redis_client.xgroup_create(CLICK_STREAM, CLICK_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def stream_id(entry_id: str) -> tuple[int, int]:
+    """
+    "ms-seq" stream entry ID as a comparable tuple.
+    """
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def count_link_clicks(entries: list) -> dict:
+    """
+    Folds stream entries into short_code -> [clicks, last click epoch].
+    """
+    counters = {}
+    for _, fields in entries:
+        # Entries deleted from the stream while pending come back without fields
+        if not fields:
+            continue
+        counter = counters.setdefault(fields["c"], [0, 0.0])
+        counter[0] += 1
+        counter[1] = max(counter[1], float(fields["t"]))
+    return counters
+
+
+def aggregate_clicks(entries: list) -> tuple[dict, dict, dict]:
+    """
+    Folds stream entries into (hour, short_code) -> clicks,
+    (short_code, period, start) -> visitors and
+    (short_code, leaderboard slot) -> clicks.
+    """
+    hourly = {}
+    visitors = {}
+    top = {}
+    for _, fields in entries:
+        if not fields:
+            continue
+        clicked_at = float(fields["t"])
+        key = (hour_of(clicked_at), fields["c"])
+        hourly[key] = hourly.get(key, 0) + 1
+        key = (fields["c"], top_slot_of(clicked_at))
+        top[key] = top.get(key, 0) + 1
+        if fields.get("v"):
+            for period, period_start in visitor_windows(clicked_at):
+                visitors.setdefault((fields["c"], period, period_start), set()).add(fields["v"])
+    return hourly, visitors, top
+
+
+async def apply_click_events(
+    session_maker: async_sessionmaker, redis_client: aioredis.Redis, consumer: str, entries: list
+) -> int:
+    """
+    Adds one batch of click events of a consumer to linkdata in a single
+    UPDATE, skipping the ones its committed offset already covers, and once
+    committed to the hourly buckets, visitor sketches and leaderboard slots
+    together with the acknowledgement.
+    Returns the number of links updated.
+    """
+    CLICK_BATCH_EVENTS.observe(len(entries))
+    updated = 0
+    async with session_maker() as session:
+        # Creates or locks the consumer's offset row: an aggregator replaying
+        # the same entries waits for this transaction and then skips them
+        result = await session.execute(
+            insert(click_stream_offsets)
+            .values(consumer=consumer, last_id="0-0", updated_at=datetime.utcnow())
+            .on_conflict_do_update(
+                index_elements=[click_stream_offsets.c.consumer],
+                set_={"last_id": click_stream_offsets.c.last_id},
+            )
+            .returning(click_stream_offsets.c.last_id)
+        )
+        applied = stream_id(result.scalar_one())
+        fresh = [entry for entry in entries if stream_id(entry[0]) > applied]
+        counters = count_link_clicks(fresh)
+        if counters:
+            deltas = values(
+                column("code_id", BigInteger), column("short_code", String), column("clicks", Integer),
+                column("last_used_at", DateTime),
+                name="deltas",
+            ).data([
+                (code_id_of(short_code), short_code, clicks, datetime.utcfromtimestamp(last_click))
+                for short_code, (clicks, last_click) in counters.items()
+            ])
+            result = await session.execute(
+                update(linkdata)
+                .where(
+                    linkdata.c.code_id == deltas.c.code_id,
+                    func.lower(linkdata.c.short_code) == deltas.c.short_code,
+                )
+                .values(
+                    usage_count=func.coalesce(linkdata.c.usage_count, 0) + deltas.c.clicks,
+                    last_used_at=func.greatest(linkdata.c.last_used_at, deltas.c.last_used_at),
+                )
+            )
+            updated = result.rowcount
+        if fresh:
+            await session.execute(
+                update(click_stream_offsets)
+                .where(click_stream_offsets.c.consumer == consumer)
+                .values(last_id=max((entry[0] for entry in fresh), key=stream_id), updated_at=datetime.utcnow())
+            )
+        await session.commit()
+
+    # MULTI: the buckets are counted exactly when the events are acknowledged
+    hourly, visitors, top = aggregate_clicks(entries)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        count_hourly_clicks(pipe, hourly)
+        add_visitors(pipe, visitors)
+        count_top_clicks(pipe, top)
+        pipe.xack(CLICK_STREAM, CLICK_GROUP, *[entry_id for entry_id, _ in entries])
+        await pipe.execute()
+    return updated
+
+
+async def claim_stale_events(session_maker: async_sessionmaker, redis_client: aioredis.Redis, consumer: str) -> int:
+    """
+    Applies events that other consumers received but never acknowledged
+    (crashed or stuck for CLICK_CLAIM_IDLE_MS). The events stay with their
+    consumer and are applied against its offset: only the idle head of its
+    pending list is taken, the entries it is still working on are newer.
+    Consumers idle for CLICK_CONSUMER_EXPIRY_MS with nothing pending are
+    removed from the group together with their offset.
+    """
+    claimed = 0
+    for owner in await redis_client.xinfo_consumers(CLICK_STREAM, CLICK_GROUP):
+        if owner["name"] == consumer:
+            continue
+        if not owner["pending"]:
+            if owner["idle"] >= CLICK_CONSUMER_EXPIRY_MS:
+                await redis_client.xgroup_delconsumer(CLICK_STREAM, CLICK_GROUP, owner["name"])
+                async with session_maker() as session:
+                    await session.execute(
+                        delete(click_stream_offsets).where(click_stream_offsets.c.consumer == owner["name"])
+                    )
+                    await session.commit()
+            continue
+        while True:
+            pending = await redis_client.xpending_range(
+                CLICK_STREAM, CLICK_GROUP, min="-", max="+", count=CLICK_BATCH_SIZE, consumername=owner["name"]
+            )
+            stale = []
+            for entry in pending:
+                if entry["time_since_delivered"] < CLICK_CLAIM_IDLE_MS:
+                    break
+                stale.append(entry["message_id"])
+            if not stale:
+                break
+            # Reclaiming for the owner resets the idle time, another
+            # aggregator sweeping at the same time gets nothing
+            entries = await redis_client.xclaim(
+                CLICK_STREAM, CLICK_GROUP, owner["name"], CLICK_CLAIM_IDLE_MS, stale
+            )
+            claimed_ids = [entry_id for entry_id, _ in entries]
+            # Stop at the first entry the owner touched in the meantime
+            head = 0
+            while head < len(claimed_ids) and claimed_ids[head] == stale[head]:
+                head += 1
+            if not head:
+                break
+            await apply_click_events(session_maker, redis_client, owner["name"], entries[:head])
+            claimed += head
+            if head < len(stale):
+                break
+    return claimed
+
+
+async def trim_click_stream(redis_client: aioredis.Redis) -> None:
+    """
+    Trims the click stream up to the group's oldest pending entry, or past
+    its last delivered one when nothing is pending.
+    """
+    groups = await redis_client.xinfo_groups(CLICK_STREAM)
+    group = next((group for group in groups if group["name"] == CLICK_GROUP), None)
+    if group is None:
+        return
+    # Read before the pending entries: whatever is delivered in between is newer
+    min_id = group["last-delivered-id"]
+    pending = await redis_client.xpending(CLICK_STREAM, CLICK_GROUP)
+    if pending["min"] and stream_id(pending["min"]) < stream_id(min_id):
+        min_id = pending["min"]
+    await redis_client.xtrim(CLICK_STREAM, minid=min_id, approximate=True)
+
+
+async def run_aggregator(session_maker: async_sessionmaker, redis_client: aioredis.Redis, consumer: str) -> None:
+    await ensure_consumer_group(redis_client)
+    # "0" re-reads this consumer's own pending events (after a restart under the
+    # same name or a failed batch), ">" reads new ones
+    read_id = "0"
+    next_claim = 0.0
+    while True:
+        try:
+            if time.monotonic() >= next_claim:
+                claimed = await claim_stale_events(session_maker, redis_client, consumer)
+                if claimed:
+                    logger.warning("Replayed %s click events left pending by other consumers", claimed)
+                await trim_click_stream(redis_client)
+                next_claim = time.monotonic() + CLICK_CLAIM_IDLE_MS / 1000
+
+            response = await redis_client.xreadgroup(
+                CLICK_GROUP, consumer, {CLICK_STREAM: read_id}, count=CLICK_BATCH_SIZE,
+                block=CLICK_BLOCK_MS if read_id == ">" else None,
+            )
+            entries = response[0][1] if response else []
+            if not entries:
+                read_id = ">"
+                continue
+
+            started = time.monotonic()
+            with track_task("click_batch"):
+                updated = await apply_click_events(session_maker, redis_client, consumer, entries)
+            logger.debug("Applied %s click events to %s links in %.3fs", len(entries), updated, time.monotonic() - started)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Click aggregation failed, retrying the pending events")
+            read_id = "0"
+            await asyncio.sleep(1)
+
+
+async def main() -> None:
+    consumer = os.getenv("CLICK_CONSUMER_NAME") or f"{socket.gethostname()}-{os.getpid()}"
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+    init_redis_pool()
+    try:
+        await run_aggregator(async_session_maker, get_redis_client(), consumer)
+    finally:
+        await close_redis_pool()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+"""
+Celery worker and beat for the maintenance jobs, kept out of the API processes:
+
+    celery --app=src.tasks.celery_app:celery worker -Q maintenance,clicks
+    celery --app=src.tasks.celery_app:celery beat
+
+(docker/celery.sh). Each task runs its coroutine in a fresh event loop, so
+database connections and Redis clients are opened per task and never
+shared across loops.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from celery import Celery
+from celery.signals import worker_init
+from redis import asyncio as aioredis
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.config import (
+    CELERY_BROKER_URL, CLICK_ROLLUP_INTERVAL, LINK_EXPIRY_INTERVAL, MAINTENANCE_INTERVAL, METRICS_PORT, REDIS_URL,
+)
+from src.database import DATABASE_URL
+from src.metrics import InstrumentedRedis, instrument_engine, serve_metrics, track_task
+from src.tasks.maintenance import MAINTENANCE_LOCK_TTL, run_deactivation_jobs
+from src.tinylink import partitions as link_partitions
+from src.tinylink.analytics import rollup_click_buckets
+from src.tinylink.visitors import persist_visitor_sketches
+
+
+logger = logging.getLogger(__name__)
+
+celery = Celery("tinylink", broker=CELERY_BROKER_URL)
+celery.conf.update(
+    task_routes={
+        "src.tasks.celery_app.expire_links": {"queue": "maintenance"},
+        "src.tasks.celery_app.deactivate_unused_links": {"queue": "maintenance"},
+        "src.tasks.celery_app.maintain_link_partitions": {"queue": "maintenance"},
+        "src.tasks.celery_app.flush_click_counters": {"queue": "clicks"},
+    },
+    # Long batched jobs: one at a time per worker process, acknowledged when
+    # done so a crashed worker's task is redelivered
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_ignore_result=True,
+    broker_connection_retry_on_startup=True,
+    beat_schedule={
+        "expire-links": {"task": "src.tasks.celery_app.expire_links", "schedule": LINK_EXPIRY_INTERVAL},
+        "maintain-link-partitions": {
+            "task": "src.tasks.celery_app.maintain_link_partitions", "schedule": LINK_EXPIRY_INTERVAL,
+        },
+        "deactivate-unused-links": {
+            "task": "src.tasks.celery_app.deactivate_unused_links", "schedule": MAINTENANCE_INTERVAL,
+        },
+        "flush-click-counters": {"task": "src.tasks.celery_app.flush_click_counters", "schedule": CLICK_ROLLUP_INTERVAL},
+    },
+)
+
+@worker_init.connect
+def serve_worker_metrics(**_):
+    # Pool processes write to PROMETHEUS_MULTIPROC_DIR (docker/celery.sh),
+    # the main process serves the sum
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+
+
+# No pooled connections: every task has its own event loop
+engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+instrument_engine(engine)
+session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+
+@asynccontextmanager
+async def redis_clients() -> AsyncIterator[tuple[aioredis.Redis, aioredis.Redis]]:
+    redis_client = InstrumentedRedis.from_url(REDIS_URL, decode_responses=True)
+    raw_redis = InstrumentedRedis.from_url(REDIS_URL)
+    try:
+        yield redis_client, raw_redis
+    finally:
+        await redis_client.aclose()
+        await raw_redis.aclose()
+
+
+async def deactivate(jobs: tuple[str, ...]):
+    async with redis_clients() as (redis_client, _):
+        return await run_deactivation_jobs(session_maker, redis_client, jobs)
+
+
+async def maintain_partitions() -> dict:
+    async with redis_clients() as (redis_client, _), session_maker() as session:
+        return await link_partitions.maintain_link_partitions(session, redis_client)
+
+
+async def flush_clicks() -> dict:
+    async with redis_clients() as (redis_client, raw_redis):
+        return {
+            "buckets": await rollup_click_buckets(session_maker, redis_client),
+            "sketches": await persist_visitor_sketches(session_maker, redis_client, raw_redis),
+        }
+
+
+# The deactivation jobs share a Redis lock, a run that finds it held is
+# retried once the holder had time to finish. Rate limits are per worker and
+# keep manual triggers from queueing runs back to back.
+@celery.task(bind=True, rate_limit="12/h", time_limit=60 * 60, max_retries=30)
+def expire_links(self):
+    with track_task("expire_links"):
+        result = asyncio.run(deactivate(("expired",)))
+    if result is None:
+        raise self.retry(countdown=MAINTENANCE_LOCK_TTL)
+    return result
+
+
+@celery.task(bind=True, rate_limit="4/h", time_limit=6 * 60 * 60, max_retries=30)
+def deactivate_unused_links(self):
+    with track_task("deactivate_unused_links"):
+        result = asyncio.run(deactivate(("unused", "never_used")))
+    if result is None:
+        raise self.retry(countdown=MAINTENANCE_LOCK_TTL)
+    return result
+
+
+# Creates the anonymous partitions ahead of the ID sequence and drops
+# the expired ones
+@celery.task(rate_limit="12/h", time_limit=60 * 60)
+def maintain_link_partitions():
+    with track_task("maintain_link_partitions"):
+        return asyncio.run(maintain_partitions())
+
+
+@celery.task(rate_limit="60/h", time_limit=CLICK_ROLLUP_INTERVAL * 2)
+def flush_click_counters():
+    with track_task("flush_click_counters"):
+        return asyncio.run(flush_clicks())
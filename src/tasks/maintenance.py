@@ -0,0 +1,165 @@
+"""
+Link deactivation, scheduled by Celery beat (src/tasks/celery_app.py). One
+run at a time holds MAINTENANCE_LOCK and deactivates the links in batches
+of MAINTENANCE_BATCH_SIZE, each its own short transaction, recording its
+progress in MAINTENANCE_PROGRESS_KEY.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from redis import asyncio as aioredis
+from sqlalchemy import and_, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from src.config import DEACTIVATION_DAYS, MAINTENANCE_BATCH_SIZE
+from src.tinylink.cache import forget_url
+from src.tinylink.codes import ANONYMOUS_ID_START
+from src.tinylink.invalidation import publish_invalidation
+from src.tinylink.models import linkdata
+from src.tinylink.scripts import EXTEND_LOCK_LUA, RELEASE_LOCK_LUA
+
+
+MAINTENANCE_LOCK = "maintenance:lock"
+# Renewed after every batch, a worker that dies frees the lock this fast
+MAINTENANCE_LOCK_TTL = 60
+# Hash of job -> JSON progress of the current or last run
+MAINTENANCE_PROGRESS_KEY = "maintenance:progress"
+DEACTIVATION_JOBS = ("unused", "expired", "never_used")
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceLockLost(Exception):
+    pass
+
+
+def deactivation_condition(job: str, now: datetime):
+    """
+    Anonymous links are left alone: they are removed with their partition
+    once expired (src/tinylink/partitions.py), updating them would only
+    leave dead rows behind. Links of registered users are deactivated
+    wherever they are, including aliases created in the anonymous ranges
+    before aliases were kept out of them.
+    """
+    threshold = now - timedelta(days=int(DEACTIVATION_DAYS))
+    if job == "unused":
+        condition = linkdata.c.last_used_at < threshold
+    elif job == "expired":
+        condition = linkdata.c.expires_at < now
+    else:
+        # Never clicked since created, unused leaves them out (NULL < threshold)
+        condition = and_(linkdata.c.created < threshold, linkdata.c.last_used_at.is_(None))
+    return and_(or_(linkdata.c.code_id < ANONYMOUS_ID_START, linkdata.c.user_id.isnot(None)), condition)
+
+
+async def deactivate_batch(session: AsyncSession, condition, batch_size: int = MAINTENANCE_BATCH_SIZE) -> list:
+    """
+    Deactivates up to batch_size active links matching condition and commits.
+    Rows locked by a concurrent transaction are skipped rather than waited for.
+    Returns (short_code, original_url, url_digest) of the deactivated links.
+    """
+    candidates = (
+        select(linkdata.c.code_id)
+        .where(linkdata.c.is_active == True, condition)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    result = await session.execute(
+        update(linkdata)
+        .where(linkdata.c.code_id.in_(candidates.scalar_subquery()))
+        .values(is_active=False)
+        .returning(linkdata.c.short_code, linkdata.c.original_url, linkdata.c.url_digest)
+    )
+    rows = result.fetchall()
+    await session.commit()
+    return rows
+
+
+async def evict_links(redis_client: aioredis.Redis, rows: list) -> None:
+    """
+    Drops deactivated links from the Redis and worker caches, the next
+    redirect reloads them and answers 403.
+    """
+    codes = [row.short_code.lower() for row in rows if row.short_code]
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for short_code in codes:
+            pipe.delete(f"link:{short_code}")
+        for row in rows:
+            if row.url_digest:
+                forget_url(pipe, row.url_digest)
+        await pipe.execute()
+    if codes:
+        await publish_invalidation(redis_client, *codes)
+
+
+async def record_progress(redis_client: aioredis.Redis, job: str, progress: dict) -> None:
+    await redis_client.hset(MAINTENANCE_PROGRESS_KEY, job, json.dumps(progress))
+
+
+async def run_deactivation_job(
+    session_maker: async_sessionmaker, redis_client: aioredis.Redis, job: str, lock_token: str
+) -> int:
+    now = datetime.utcnow()
+    condition = deactivation_condition(job, now)
+    progress = {
+        "state": "running", "worker": f"{socket.gethostname()}-{os.getpid()}",
+        "started_at": now.isoformat(), "finished_at": None, "batches": 0, "rows": 0, "rows_per_second": None,
+    }
+    started = time.monotonic()
+    await record_progress(redis_client, job, progress)
+    try:
+        async with session_maker() as session:
+            while True:
+                rows = await deactivate_batch(session, condition)
+                if not rows:
+                    break
+                await evict_links(redis_client, rows)
+                progress["batches"] += 1
+                progress["rows"] += len(rows)
+                progress["rows_per_second"] = round(progress["rows"] / max(time.monotonic() - started, 1e-6), 1)
+                await record_progress(redis_client, job, progress)
+                if not await redis_client.eval(EXTEND_LOCK_LUA, 1, MAINTENANCE_LOCK, lock_token, MAINTENANCE_LOCK_TTL):
+                    raise MaintenanceLockLost(job)
+    except BaseException:
+        progress["state"] = "failed"
+        raise
+    else:
+        progress["state"] = "done"
+    finally:
+        progress["finished_at"] = datetime.utcnow().isoformat()
+        await record_progress(redis_client, job, progress)
+
+    if progress["rows"]:
+        logger.info("Deactivated %s %s links in %.1fs", progress["rows"], job, time.monotonic() - started)
+    return progress["rows"]
+
+
+async def run_deactivation_jobs(
+    session_maker: async_sessionmaker, redis_client: aioredis.Redis, jobs: tuple[str, ...]
+) -> Optional[dict]:
+    """
+    Runs the given jobs unless another run holds the lock.
+    Returns job -> links deactivated, or None if skipped.
+    """
+    lock_token = uuid.uuid4().hex
+    if not await redis_client.set(MAINTENANCE_LOCK, lock_token, nx=True, ex=MAINTENANCE_LOCK_TTL):
+        return None
+    try:
+        return {job: await run_deactivation_job(session_maker, redis_client, job, lock_token) for job in jobs}
+    finally:
+        await redis_client.eval(RELEASE_LOCK_LUA, 1, MAINTENANCE_LOCK, lock_token)
+
+
+async def maintenance_status(redis_client: aioredis.Redis) -> dict:
+    progress = await redis_client.hgetall(MAINTENANCE_PROGRESS_KEY)
+    return {
+        "running": bool(await redis_client.exists(MAINTENANCE_LOCK)),
+        "jobs": {job: json.loads(progress[job]) for job in DEACTIVATION_JOBS if job in progress},
+    }
@@ -0,0 +1,275 @@
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import delete, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from src.config import CLICK_BUCKET_RETENTION_DAYS, CLICK_ROLLUP_INTERVAL
+from src.tinylink.models import link_click_rollups, link_clicks_hourly
+from src.tinylink.scripts import RELEASE_LOCK_LUA
+
+
+# Hash per hour, short code -> clicks, filled by the click aggregator
+HOURLY_KEY = "clicks:hourly:{hour}"
+# Hours that have a hash waiting for the rollup
+HOURS_KEY = "clicks:hours"
+# Hours whose hash was moved aside and is being written to the database
+ROLLUPS_KEY = "clicks:rollups"
+# ID of a hash moved aside, recorded in link_click_rollups when written
+ROLLUP_ID_KEY = "{rollup}:id"
+ROLLUP_LOCK = "clicks:rollup:lock"
+ROLLUP_BATCH_SIZE = 5000
+# Bounds Redis memory if the rollup stops running
+HOURLY_KEY_TTL = 7 * 24 * 60 * 60
+GRANULARITIES = ("hour", "day")
+
+# Moves an hour's hash aside for the rollup, clicks counted later for the
+# same hour start a new hash and are rolled up on the next run. An hour
+# whose previous rollup is still pending waits for the next run.
+# KEYS: hourly hash, rollup hash, hours set, rollups set; ARGV: hour
+ROLLUP_SWAP_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+redis.call('SREM', KEYS[3], ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('SADD', KEYS[4], ARGV[1])
+return 1
+"""
+
+logger = logging.getLogger(__name__)
+
+_known_partitions: set[str] = set()
+
+
+def hour_of(timestamp: float) -> str:
+    return datetime.utcfromtimestamp(timestamp).strftime("%Y%m%d%H")
+
+
+def count_hourly_clicks(pipe: Pipeline, hourly_clicks: dict) -> None:
+    """
+    Queues the HINCRBYs for {(hour, short_code): clicks}.
+    """
+    for (hour, short_code), clicks in hourly_clicks.items():
+        pipe.hincrby(HOURLY_KEY.format(hour=hour), short_code, clicks)
+    for hour in {hour for hour, _ in hourly_clicks}:
+        pipe.expire(HOURLY_KEY.format(hour=hour), HOURLY_KEY_TTL)
+        pipe.sadd(HOURS_KEY, hour)
+
+
+def partition_name(month: datetime) -> str:
+    return f"link_clicks_hourly_p{month:%Y%m}"
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def retention_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(days=CLICK_BUCKET_RETENTION_DAYS)
+
+
+async def ensure_partitions(session: AsyncSession, months: set[datetime]) -> None:
+    for month in sorted(months):
+        name = partition_name(month)
+        if name in _known_partitions:
+            continue
+        await session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF link_clicks_hourly "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+        ))
+        _known_partitions.add(name)
+
+
+async def drop_expired_partitions(session: AsyncSession) -> list[str]:
+    """
+    Retention: drops the monthly partitions that end before the cutoff.
+    """
+    result = await session.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'link_clicks_hourly'"
+    ))
+    cutoff = retention_cutoff()
+    dropped = []
+    for name in result.scalars():
+        month = datetime.strptime(name.rsplit("_p", 1)[1], "%Y%m")
+        if next_month(month) <= cutoff:
+            await session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            _known_partitions.discard(name)
+            dropped.append(name)
+    # Hashes of hours before the cutoff are not written, their IDs are not needed
+    await session.execute(delete(link_click_rollups).where(link_click_rollups.c.bucket < cutoff))
+    return dropped
+
+
+async def write_rollup(session: AsyncSession, redis_client: aioredis.Redis, hour: str, rollup_id: str) -> int:
+    """
+    Adds an hour's moved-aside hash to link_clicks_hourly, unless the
+    rollup_id shows it was committed by a run that died before deleting it.
+    """
+    bucket = datetime.strptime(hour, "%Y%m%d%H")
+    if bucket < retention_cutoff():
+        return 0
+    result = await session.execute(
+        insert(link_click_rollups)
+        .values(rollup_id=rollup_id, bucket=bucket, rolled_up_at=datetime.utcnow())
+        .on_conflict_do_nothing()
+        .returning(link_click_rollups.c.rollup_id)
+    )
+    if result.first() is None:
+        logger.warning("Hourly clicks of %s (rollup %s) were already written, skipped", hour, rollup_id)
+        return 0
+    await ensure_partitions(session, {month_start(bucket)})
+
+    rows = []
+    written = 0
+    async for short_code, clicks in redis_client.hscan_iter(f"{HOURLY_KEY.format(hour=hour)}:rollup", count=1000):
+        rows.append({"short_code": short_code, "bucket": bucket, "clicks": int(clicks)})
+        if len(rows) == ROLLUP_BATCH_SIZE:
+            written += await upsert_buckets(session, rows)
+            rows = []
+    if rows:
+        written += await upsert_buckets(session, rows)
+    return written
+
+
+async def upsert_buckets(session: AsyncSession, rows: list[dict]) -> int:
+    stmt = insert(link_clicks_hourly).values(rows)
+    # Additive: an hour can be rolled up more than once (late events), each
+    # hash once (write_rollup)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[link_clicks_hourly.c.short_code, link_clicks_hourly.c.bucket],
+        set_={"clicks": link_clicks_hourly.c.clicks + stmt.excluded.clicks},
+    ))
+    return len(rows)
+
+
+async def rollup_click_buckets(session_maker: async_sessionmaker, redis_client: aioredis.Redis) -> int:
+    """
+    Writes the hourly hashes of finished hours to link_clicks_hourly and
+    applies the retention policy. One worker at a time.
+
+    An hour is committed before its hash is deleted. The hash's ID is
+    committed with it, so if the process dies in between the next run finds
+    the ID and only deletes the hash.
+    """
+    lock_token = uuid.uuid4().hex
+    if not await redis_client.set(ROLLUP_LOCK, lock_token, nx=True, ex=CLICK_ROLLUP_INTERVAL * 2):
+        return 0
+
+    started = time.monotonic()
+    written = 0
+    current_hour = hour_of(time.time())
+    try:
+        # Hashes moved aside by a run that did not finish go first
+        hours = sorted(await redis_client.smembers(ROLLUPS_KEY))
+        for hour in sorted(await redis_client.smembers(HOURS_KEY)):
+            if hour < current_hour and await redis_client.eval(
+                ROLLUP_SWAP_LUA, 4, HOURLY_KEY.format(hour=hour), f"{HOURLY_KEY.format(hour=hour)}:rollup",
+                HOURS_KEY, ROLLUPS_KEY, hour,
+            ):
+                hours.append(hour)
+
+        async with session_maker() as session:
+            for hour in dict.fromkeys(hours):
+                rollup = f"{HOURLY_KEY.format(hour=hour)}:rollup"
+                id_key = ROLLUP_ID_KEY.format(rollup=rollup)
+                # Given on first sight, hashes moved aside by a run that
+                # did not finish keep theirs
+                await redis_client.set(id_key, uuid.uuid4().hex, nx=True, ex=HOURLY_KEY_TTL)
+                written += await write_rollup(session, redis_client, hour, await redis_client.get(id_key))
+                await session.commit()
+                async with redis_client.pipeline(transaction=True) as pipe:
+                    pipe.delete(rollup, id_key)
+                    pipe.srem(ROLLUPS_KEY, hour)
+                    await pipe.execute()
+
+            dropped = await drop_expired_partitions(session)
+            await session.commit()
+    finally:
+        await redis_client.eval(RELEASE_LOCK_LUA, 1, ROLLUP_LOCK, lock_token)
+
+    if hours or dropped:
+        logger.info(
+            "Rolled up %s hours (%s buckets) in %.3fs, dropped partitions: %s",
+            len(hours), written, time.monotonic() - started, dropped or "none",
+        )
+    return written
+
+
+async def click_series(
+    session: AsyncSession,
+    redis_client: aioredis.Redis,
+    short_code: str,
+    start: datetime,
+    end: datetime,
+    granularity: str,
+) -> list[dict]:
+    """
+    Clicks per hour or day in [start, end): one range scan of the
+    (short_code, bucket) primary key, plus the hours not rolled up yet.
+    """
+    short_code = short_code.lower()
+    bucket = func.date_trunc(granularity, link_clicks_hourly.c.bucket).label("bucket")
+    result = await session.execute(
+        select(bucket, func.sum(link_clicks_hourly.c.clicks))
+        .where(
+            link_clicks_hourly.c.short_code == short_code,
+            link_clicks_hourly.c.bucket >= start,
+            link_clicks_hourly.c.bucket < end,
+        )
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    series = {row[0]: int(row[1]) for row in result}
+
+    # The current hour, and the previous one until the next rollup, only
+    # exist in Redis
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    recent = [hour for hour in (now - timedelta(hours=1), now) if start <= hour < end]
+    if recent:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for hour in recent:
+                pipe.hget(HOURLY_KEY.format(hour=f"{hour:%Y%m%d%H}"), short_code)
+            for hour, clicks in zip(recent, await pipe.execute()):
+                if clicks:
+                    key = hour if granularity == "hour" else hour.replace(hour=0)
+                    series[key] = series.get(key, 0) + int(clicks)
+
+    return [{"bucket": key, "clicks": series[key]} for key in sorted(series)]
+
+
+def as_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_range(
+    start: Optional[datetime], end: Optional[datetime], granularity: str
+) -> tuple[datetime, datetime]:
+    """
+    Defaults to the last 7 days, naive UTC, aligned to the granularity.
+    """
+    end = as_utc(end) if end else datetime.utcnow()
+    start = as_utc(start) if start else end - timedelta(days=7)
+    start = start.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        start = start.replace(hour=0)
+    return start, end
@@ -0,0 +1,319 @@
+import codecs
+import json
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from typing import AsyncIterator, BinaryIO, Iterator
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from redis import asyncio as aioredis
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from src.tinylink.bloom import add_to_bloom
+from src.tinylink.cache import CachedLink, cache_link, negative_cache_key, remember_url, to_epoch
+from src.tinylink.codes import SHORT_CODE_ATTEMPTS, code_allocators, code_id_of
+from src.tinylink.models import linkdata, url_digest
+from src.tinylink.schemas import LinkCreate, LinkResponse
+
+
+# Items handled per dedupe query, INSERT, commit and Redis pipeline
+BATCH_CHUNK_SIZE = 1000
+BATCH_READ_SIZE = 64 * 1024
+# Request bodies larger than this are spooled to disk
+BATCH_SPOOL_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_expires_at(link: LinkCreate, user_id) -> datetime:
+    # Устанавливаем expires_at, если пользователь не залогинен (по умолчанию 1 неделя)
+    if user_id is None:
+        expires_at = datetime.utcnow() + timedelta(weeks=1)
+    else:
+        expires_at = link.expires_at
+
+    if isinstance(expires_at, str):
+        expires_at = datetime.strptime(expires_at, '%Y-%m-%d %H:%M:%S.%f')
+
+    # linkdata.expires_at is NOT NULL
+    if expires_at is None:
+        raise HTTPException(status_code=400, detail="Expiration date is required for registered users")
+
+    # Проверяем, что expires_at не истек
+    if expires_at < datetime.utcnow():
+        raise HTTPException(status_code=400, detail="Expiration date cannot be in the past")
+    return expires_at
+
+
+async def spool_request_body(request: Request) -> BinaryIO:
+    """
+    Copies the body aside before the response starts: a streaming response
+    listens for disconnects on the same channel the body arrives on.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_SIZE)
+    async for chunk in request.stream():
+        body.write(chunk)
+    body.seek(0)
+    return body
+
+
+def iter_json_items(body: BinaryIO) -> Iterator[object]:
+    """
+    Yields the items of a JSON array or of NDJSON, reading the body in chunks.
+    Raises json.JSONDecodeError on malformed input.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos = "", 0
+    # started once the body has its first item or "[", closed after the "]"
+    started = in_array = closed = eof = False
+    # Array items must be separated by commas, NDJSON items by whitespace,
+    # and a comma must be followed by another item
+    expect_comma = expect_item = False
+
+    while True:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos < len(buffer):
+            if closed:
+                raise json.JSONDecodeError("Extra data", buffer, pos)
+            if buffer[pos] == "[" and not started:
+                started = in_array = True
+                pos += 1
+                continue
+            if expect_comma:
+                if buffer[pos] == "]":
+                    closed = True
+                elif buffer[pos] == ",":
+                    expect_item = True
+                else:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+                expect_comma = False
+                pos += 1
+                continue
+            if buffer[pos] == "]" and in_array and not expect_item:
+                # Empty array
+                closed = True
+                pos += 1
+                continue
+            if buffer[pos] in ",]":
+                raise json.JSONDecodeError("Expecting value", buffer, pos)
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Item continues in the next chunk
+                if eof:
+                    raise
+            else:
+                # A number may continue in the next chunk as well
+                if end < len(buffer) or eof:
+                    yield item
+                    pos = end
+                    started = True
+                    expect_comma, expect_item = in_array, False
+                    continue
+        elif eof:
+            if in_array and not closed:
+                raise json.JSONDecodeError("Unterminated array", buffer, pos)
+            return
+
+        chunk = body.read(BATCH_READ_SIZE)
+        eof = not chunk
+        buffer = buffer[pos:] + text_decoder.decode(chunk, final=eof)
+        pos = 0
+
+
+def batch_line(index: int, **fields) -> str:
+    return json.dumps({"index": index, **fields}) + "\n"
+
+
+async def shorten_chunk(
+    session: AsyncSession, redis_client: aioredis.Redis, user_id, items: list[tuple[int, object]]
+) -> list[str]:
+    """
+    Shortens up to BATCH_CHUNK_SIZE items with one dedupe query, one alias
+    query and one multi-row INSERT, then warms Redis in one pipeline.
+    """
+    results: dict[int, str] = {}
+    pending = []
+    for index, item in items:
+        try:
+            link = LinkCreate(original_url=item) if isinstance(item, str) else LinkCreate.model_validate(item)
+            expires_at = resolve_expires_at(link, user_id)
+        except ValidationError as e:
+            results[index] = batch_line(index, error=e.errors(include_url=False, include_context=False, include_input=False))
+        except (HTTPException, ValueError) as e:
+            results[index] = batch_line(index, error=getattr(e, "detail", str(e)))
+        else:
+            pending.append((index, link, url_digest(link.original_url), expires_at))
+
+    aliases = {code_id_of(link.custom_alias): link.custom_alias.lower() for _, link, _, _ in pending if link.custom_alias}
+    taken = set()
+    if aliases:
+        result = await session.execute(
+            select(func.lower(linkdata.c.short_code)).where(linkdata.c.code_id.in_(aliases))
+        )
+        taken = set(result.scalars())
+
+    digests = {digest for _, _, digest, _ in pending}
+    existing = {}
+    if digests:
+        result = await session.execute(
+            select(linkdata.c.url_digest, linkdata.c.original_url, linkdata.c.short_code, linkdata.c.user_id)
+            .where(
+                linkdata.c.url_digest.in_(digests),
+                linkdata.c.is_active == True,
+                linkdata.c.expires_at > datetime.utcnow(),
+            )
+        )
+        for row in result:
+            existing.setdefault((row.url_digest, row.original_url), row)
+
+    # Same checks as shorten_link: a taken alias is an error, an already
+    # shortened URL returns the existing link
+    to_create = []
+    created_urls = {}
+    # URL -> (alias, requested expiry, index) of the item that creates it
+    created_requests = {}
+    for index, link, digest, expires_at in pending:
+        # Anonymous links expire after a week whatever was requested
+        request = (link.custom_alias and link.custom_alias.lower(), expires_at if user_id is not None else None)
+        if link.original_url in created_urls:
+            first_alias, first_expires_at, first_index = created_requests[link.original_url]
+            if request != (first_alias, first_expires_at):
+                results[index] = batch_line(
+                    index, error=f"Same URL as item {first_index} with a different alias or expiration date"
+                )
+                continue
+            # Repeated within the chunk, answered once the first one is inserted
+            created_urls[link.original_url].append(index)
+            continue
+        if link.custom_alias and link.custom_alias.lower() in taken:
+            results[index] = batch_line(index, error="Custom alias already taken")
+            continue
+        row = existing.get((digest, link.original_url))
+        if row is not None:
+            results[index] = batch_line(
+                index, **LinkResponse(short_code=row.short_code, original_url=row.original_url,
+                                      user_id=row.user_id).model_dump(mode="json")
+            )
+            continue
+        created_urls[link.original_url] = []
+        created_requests[link.original_url] = (*request, index)
+        if link.custom_alias:
+            taken.add(link.custom_alias.lower())
+        to_create.append((index, link, digest, expires_at))
+
+    code_length = 10 if user_id is None else 6
+    created = []
+    try:
+        for _ in range(SHORT_CODE_ATTEMPTS):
+            if not to_create:
+                break
+            codes = iter(await code_allocators[code_length].allocate_many(
+                session, sum(1 for _, link, _, _ in to_create if not link.custom_alias)
+            ))
+            rows = [
+                {
+                    "original_url": link.original_url,
+                    "url_digest": digest,
+                    "short_code": link.custom_alias or next(codes),
+                    "user_id": user_id,
+                    "expires_at": expires_at,
+                }
+                for _, link, digest, expires_at in to_create
+            ]
+            for row in rows:
+                row["code_id"] = code_id_of(row["short_code"])
+            # Rows whose code is taken are skipped instead of failing the chunk
+            result = await session.execute(
+                insert(linkdata).values(rows).on_conflict_do_nothing().returning(linkdata.c.short_code)
+            )
+            inserted = set(result.scalars())
+
+            retry = []
+            for entry, row in zip(to_create, rows):
+                index, link, digest, expires_at = entry
+                if row["short_code"] in inserted:
+                    created.append((index, row))
+                elif link.custom_alias:
+                    results[index] = batch_line(index, error="Custom alias already taken")
+                else:
+                    # A generated code that matches an alias or a code from before the allocator
+                    retry.append(entry)
+            to_create = retry
+        await session.commit()
+    except DBAPIError:
+        # Nothing of the chunk is stored: its items get an error line and the
+        # response goes on with the next chunk
+        logger.exception("Bulk shorten could not store %s links", len(created) + len(to_create))
+        await session.rollback()
+        for index, _ in created:
+            results[index] = batch_line(index, error="Could not store the link")
+        for index, _, _, _ in to_create:
+            results[index] = batch_line(index, error="Could not store the link")
+        created = to_create = []
+    for index, link, _, _ in to_create:
+        results[index] = batch_line(index, error="Could not allocate a short code")
+
+    if created:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for _, row in created:
+                code_key = row["short_code"].lower()
+                cache_link(pipe, code_key, CachedLink(row["original_url"], to_epoch(row["expires_at"]), True))
+                pipe.delete(negative_cache_key(code_key))
+                add_to_bloom(pipe, code_key)
+                remember_url(pipe, row["url_digest"], row["short_code"], user_id, row["expires_at"])
+            await pipe.execute()
+
+    for index, row in created:
+        response = LinkResponse(
+            short_code=row["short_code"], original_url=row["original_url"],
+            user_id=user_id, expires_at=row["expires_at"],
+        ).model_dump(mode="json")
+        results[index] = batch_line(index, **response)
+        for duplicate in created_urls[row["original_url"]]:
+            results[duplicate] = batch_line(duplicate, **response)
+    # Duplicates of a URL whose insert failed share its error
+    for url, duplicates in created_urls.items():
+        for duplicate in duplicates:
+            results.setdefault(duplicate, batch_line(duplicate, error="Duplicate of a failed item"))
+
+    return [results[index] for index in sorted(results)]
+
+
+async def shorten_batch(
+    body: BinaryIO, user_id, session_maker: async_sessionmaker, redis_client: aioredis.Redis
+) -> AsyncIterator[str]:
+    """
+    Streams one NDJSON result line per input item, in input order. Chunks are
+    committed as they go, so a failed request keeps the links already returned.
+    """
+    items = iter_json_items(body)
+    index = 0
+    try:
+        async with session_maker() as session:
+            while True:
+                chunk = []
+                try:
+                    for item in items:
+                        chunk.append((index, item))
+                        index += 1
+                        if len(chunk) == BATCH_CHUNK_SIZE:
+                            break
+                except json.JSONDecodeError as e:
+                    for line in await shorten_chunk(session, redis_client, user_id, chunk):
+                        yield line
+                    yield batch_line(index, error=f"Invalid JSON: {e}")
+                    return
+                if not chunk:
+                    return
+                for line in await shorten_chunk(session, redis_client, user_id, chunk):
+                    yield line
+    finally:
+        body.close()
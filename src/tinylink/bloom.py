@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.future import select
+
+from src.config import BLOOM_CAPACITY, BLOOM_ERROR_RATE, BLOOM_REBUILD_INTERVAL
+from src.metrics import BACKGROUND_TASK_DURATION
+from src.tinylink.models import linkdata
+
+
+BLOOM_KEY = "short_codes:bloom"
+# Set once the filter holds every existing short code, until then it is ignored
+BLOOM_READY_KEY = "short_codes:bloom:ready"
+# Held for BLOOM_REBUILD_INTERVAL by the worker that rebuilt the filter last
+BLOOM_REBUILD_LOCK = "short_codes:bloom:rebuild"
+# Shadow filter that receives new codes while a rebuild is scanning linkdata
+BLOOM_BUILD_KEY = "short_codes:bloom:build"
+BLOOM_UPLOAD_KEY = "short_codes:bloom:upload"
+BLOOM_CHUNK_SIZE = 1024 * 1024
+
+# Standard sizing for n items at false-positive rate p
+BLOOM_BITS = math.ceil(-BLOOM_CAPACITY * math.log(BLOOM_ERROR_RATE) / math.log(2) ** 2)
+BLOOM_HASHES = max(1, round(BLOOM_BITS / BLOOM_CAPACITY * math.log(2)))
+
+# KEYS: bloom, build; ARGV: bit offsets
+ADD_LUA = """
+local building = redis.call('EXISTS', KEYS[2]) == 1
+for i = 1, #ARGV do
+    redis.call('SETBIT', KEYS[1], ARGV[i], 1)
+    if building then
+        redis.call('SETBIT', KEYS[2], ARGV[i], 1)
+    end
+end
+return 1
+"""
+
+# Swaps the uploaded filter in, merged with the codes shortened while the
+# rebuild was running. Bits of deleted links are dropped.
+# KEYS: upload, build, bloom, ready; ARGV: number of indexed codes
+SWAP_LUA = """
+redis.call('BITOP', 'OR', KEYS[1], KEYS[1], KEYS[2])
+redis.call('RENAME', KEYS[1], KEYS[3])
+redis.call('DEL', KEYS[2])
+redis.call('SET', KEYS[4], ARGV[1])
+return 1
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def bloom_positions(short_code: str) -> list[int]:
+    """
+    Bit offsets for a short code (double hashing, case-insensitive like the lookups).
+    """
+    digest = hashlib.blake2b(short_code.lower().encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+
+def add_to_bloom(pipe: Pipeline, short_code: str) -> None:
+    pipe.eval(ADD_LUA, 2, BLOOM_KEY, BLOOM_BUILD_KEY, *bloom_positions(short_code))
+
+
+async def rebuild_bloom_filter(session_maker: async_sessionmaker, redis_client: aioredis.Redis) -> bool:
+    """
+    Builds the filter from every short code in linkdata and swaps it in.
+    Only one worker rebuilds per BLOOM_REBUILD_INTERVAL.
+    """
+    if not await redis_client.set(BLOOM_REBUILD_LOCK, time.time(), nx=True, ex=BLOOM_REBUILD_INTERVAL):
+        return False
+
+    started = time.monotonic()
+    bits = bytearray(math.ceil(BLOOM_BITS / 8))
+    count = 0
+    # Created before the scan snapshot, so codes committed after it still
+    # end up in the new filter through ADD_LUA
+    await redis_client.delete(BLOOM_BUILD_KEY, BLOOM_UPLOAD_KEY)
+    await redis_client.setbit(BLOOM_BUILD_KEY, BLOOM_BITS - 1, 0)
+    try:
+        async with session_maker() as session:
+            # Server-side cursor, the table is never held in memory
+            result = await session.stream(
+                select(linkdata.c.short_code).execution_options(yield_per=10000)
+            )
+            async for short_code in result.scalars():
+                if short_code is None:
+                    continue
+                for position in bloom_positions(short_code):
+                    # SETBIT offset 0 is the most significant bit of the first byte
+                    bits[position >> 3] |= 0x80 >> (position & 7)
+                count += 1
+
+        for offset in range(0, len(bits), BLOOM_CHUNK_SIZE):
+            await redis_client.setrange(BLOOM_UPLOAD_KEY, offset, bytes(bits[offset:offset + BLOOM_CHUNK_SIZE]))
+        await redis_client.eval(SWAP_LUA, 4, BLOOM_UPLOAD_KEY, BLOOM_BUILD_KEY, BLOOM_KEY, BLOOM_READY_KEY, count)
+    except BaseException:
+        await redis_client.delete(BLOOM_BUILD_KEY, BLOOM_UPLOAD_KEY, BLOOM_REBUILD_LOCK)
+        BACKGROUND_TASK_DURATION.labels("bloom_rebuild", "error").observe(time.monotonic() - started)
+        raise
+
+    BACKGROUND_TASK_DURATION.labels("bloom_rebuild", "ok").observe(time.monotonic() - started)
+    logger.info("Rebuilt short code bloom filter: %s codes in %.1fs", count, time.monotonic() - started)
+    return True
+
+
+async def periodic_bloom_rebuild(session_maker: async_sessionmaker, redis_client: aioredis.Redis) -> None:
+    """
+    Rebuilds on startup and then every BLOOM_REBUILD_INTERVAL, dropping bits of
+    deleted links so the false-positive rate stays near BLOOM_ERROR_RATE.
+    """
+    while True:
+        try:
+            await rebuild_bloom_filter(session_maker, redis_client)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Bloom filter rebuild failed")
+        await asyncio.sleep(BLOOM_REBUILD_INTERVAL)
+
+
+async def bloom_stats(redis_client: aioredis.Redis) -> dict:
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.bitcount(BLOOM_KEY)
+        pipe.strlen(BLOOM_KEY)
+        pipe.get(BLOOM_READY_KEY)
+        bits_set, size, indexed = await pipe.execute()
+
+    fill_ratio = bits_set / BLOOM_BITS
+    return {
+        "ready": indexed is not None,
+        "indexed_codes": int(indexed) if indexed is not None else None,
+        "capacity": BLOOM_CAPACITY,
+        "bits": BLOOM_BITS,
+        "hashes": BLOOM_HASHES,
+        "memory_bytes": size,
+        "fill_ratio": round(fill_ratio, 6),
+        "target_false_positive_rate": BLOOM_ERROR_RATE,
+        # Probability that all k bits of an unknown code are already set
+        "estimated_false_positive_rate": fill_ratio ** BLOOM_HASHES,
+    }
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, NamedTuple, Optional
+
+from redis.asyncio.client import Pipeline
+
+from src.config import L1_CACHE_MAX_ENTRIES, L1_CACHE_TTL, LINK_CACHE_TTL
+
+
+class CachedLink(NamedTuple):
+    original_url: str
+    expires_at: Optional[float]  # UTC epoch seconds, None if the link never expires
+    is_active: bool
+
+    @classmethod
+    def from_redis(cls, url: str, expires_at: str, is_active: str) -> "CachedLink":
+        """
+        Builds the record from the link:{code} hash fields (see cache_link).
+        """
+        return cls(url, float(expires_at) or None, is_active == "1")
+
+    def is_expired(self, now: float) -> bool:
+        return self.expires_at is not None and self.expires_at <= now
+
+
+def to_epoch(value: Optional[datetime]) -> Optional[float]:
+    """
+    linkdata stores naive UTC datetimes (datetime.utcnow()).
+    """
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def cached_link_ttl(link: CachedLink, cap: float, now: float) -> float:
+    """
+    Live links are cached until they expire, at most for `cap` seconds.
+    Expired and deactivated records keep the full `cap`, they only change
+    through update_link/delete_link which invalidate them.
+    """
+    if link.is_active and link.expires_at is not None and link.expires_at > now:
+        return min(cap, link.expires_at - now)
+    return cap
+
+
+def cache_link(pipe: Pipeline, short_code: str, link: CachedLink) -> None:
+    """
+    Queues the link:{code} hash read by the redirect Lua scripts.
+    """
+    key = f"link:{short_code}"
+    pipe.hset(key, mapping={
+        "url": link.original_url,
+        "exp": link.expires_at or 0,
+        "active": int(link.is_active),
+    })
+    pipe.expire(key, max(int(cached_link_ttl(link, LINK_CACHE_TTL, time.time())), 1))
+
+
+# Hash that held the shorten dedupe entries before the url:{digest} keys,
+# deleted by the warm-up (src/tinylink/warmup.py)
+LEGACY_URL_DIGEST_KEY = "url_digest"
+
+
+def url_digest_key(digest: bytes) -> str:
+    """
+    Shorten dedupe entry of md5(original_url): {"short_code", "user_id", "exp"}.
+    """
+    return f"url:{digest.hex()}"
+
+
+def remember_url(pipe: Pipeline, digest: bytes, short_code: str, user_id, expires_at: Optional[datetime]) -> None:
+    """
+    Queues the dedupe entry of a live link. It is kept until the link expires
+    and at most LINK_CACHE_TTL, older URLs are found through the digest index.
+    """
+    exp = to_epoch(expires_at)
+    ttl = LINK_CACHE_TTL if exp is None else min(LINK_CACHE_TTL, exp - time.time())
+    if ttl < 1:
+        return
+    pipe.set(url_digest_key(digest), json.dumps({
+        "short_code": short_code,
+        "user_id": str(user_id) if user_id else None,
+        "exp": exp,
+    }), ex=int(ttl))
+
+
+def remembered_url(value: Optional[str], now: float) -> Optional[dict]:
+    """
+    The dedupe entry read from url_digest_key, None if absent or expired.
+    """
+    if value is None:
+        return None
+    entry = json.loads(value)
+    if entry.get("exp") is not None and entry["exp"] <= now:
+        return None
+    return entry
+
+
+def forget_url(pipe: Pipeline, digest: bytes) -> None:
+    pipe.delete(url_digest_key(digest))
+
+
+def negative_cache_key(short_code: str) -> str:
+    """
+    Short-lived marker for codes that were not found, lookups are case-insensitive.
+    """
+    return f"miss:{short_code.lower()}"
+
+
+class LocalLinkCache:
+    """
+    Bounded per-worker short_code -> CachedLink cache with LRU eviction and TTL.
+
+    Lives in front of Redis; entries are dropped through the invalidation bus
+    (src/tinylink/invalidation.py) when a link is updated or deleted in any worker.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[CachedLink, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, short_code: str) -> Optional[CachedLink]:
+        entry = self._entries.get(short_code)
+        if entry is None:
+            self.misses += 1
+            return None
+        link, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[short_code]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(short_code)
+        self.hits += 1
+        return link
+
+    def set(self, short_code: str, link: CachedLink) -> None:
+        if self.max_entries <= 0:
+            return
+        ttl = cached_link_ttl(link, self.ttl, time.time())
+        self._entries[short_code] = (link, time.monotonic() + ttl)
+        self._entries.move_to_end(short_code)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, short_code: str) -> None:
+        if self._entries.pop(short_code, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a worker: the first
+    caller runs the loader, the others await its result.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self.loads = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.loads += 1
+            task = asyncio.ensure_future(loader())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so a cancelled caller does not cancel the load for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "loads": self.loads, "coalesced": self.coalesced}
+
+
+local_link_cache = LocalLinkCache(L1_CACHE_MAX_ENTRIES, L1_CACHE_TTL)
+link_loads = SingleFlight()
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+from typing import Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import SHORT_CODE_KEY
+
+
+# Lowercase only: short codes are matched case-insensitively (lower(short_code))
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+FEISTEL_ROUNDS = 4
+
+# Registered users get 6-character codes, anonymous links 10 characters.
+# Each length draws IDs from its own sequence; the ranges are disjoint.
+CODE_SEQUENCES = {
+    6: "short_code_registered_seq",
+    10: "short_code_anonymous_seq",
+}
+# First ID of the anonymous sequence, registered IDs are below it
+ANONYMOUS_ID_START = len(ALPHABET) ** 6
+# Generated codes can only collide with custom aliases and codes created
+# before the allocator, each retry takes the next ID
+SHORT_CODE_ATTEMPTS = 5
+
+
+class CodePermutation:
+    """
+    Reversible, non-sequential mapping between IDs in [0, 36**length) and
+    short codes of `length` characters.
+
+    A keyed Feistel network permutes the smallest even-width bit space that
+    covers the domain; cycle-walking maps it back into the domain, so
+    distinct IDs always give distinct codes.
+    """
+
+    def __init__(self, length: int, key: str):
+        self.length = length
+        self.domain = len(ALPHABET) ** length
+        bits = (self.domain - 1).bit_length()
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.key = hashlib.blake2b(f"{key}:{length}".encode(), digest_size=32).digest()
+
+    def _round(self, value: int, round_index: int) -> int:
+        digest = hashlib.blake2b(
+            value.to_bytes(8, "little") + bytes([round_index]), key=self.key, digest_size=8
+        ).digest()
+        return int.from_bytes(digest, "little") & self.half_mask
+
+    def _permute(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for i in range(FEISTEL_ROUNDS):
+            left, right = right, left ^ self._round(right, i)
+        return (left << self.half_bits) | right
+
+    def _unpermute(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for i in reversed(range(FEISTEL_ROUNDS)):
+            left, right = right ^ self._round(left, i), left
+        return (left << self.half_bits) | right
+
+    def encode(self, code_id: int) -> str:
+        if not 0 <= code_id < self.domain:
+            raise ValueError(f"Code id {code_id} is out of range for {self.length}-character codes")
+        value = self._permute(code_id)
+        while value >= self.domain:
+            value = self._permute(value)
+        chars = []
+        for _ in range(self.length):
+            value, index = divmod(value, len(ALPHABET))
+            chars.append(ALPHABET[index])
+        return "".join(reversed(chars))
+
+    def decode(self, short_code: str) -> Optional[int]:
+        """
+        Returns the ID a code was generated from, None if it cannot be a generated code.
+        """
+        short_code = short_code.lower()
+        if len(short_code) != self.length:
+            return None
+        value = 0
+        for char in short_code:
+            index = ALPHABET.find(char)
+            if index < 0:
+                return None
+            value = value * len(ALPHABET) + index
+        value = self._unpermute(value)
+        while value >= self.domain:
+            value = self._unpermute(value)
+        return value
+
+
+class CodeAllocator:
+    """
+    Hands out short codes from blocks of IDs reserved per worker.
+
+    Each nextval() on the sequence (INCREMENT BY the block size) reserves a
+    whole block, so only one shorten in a block issues a query for it.
+    on_block, if set, is called with the first ID of every reserved block.
+    """
+
+    def __init__(self, sequence: str, permutation: CodePermutation):
+        self.sequence = sequence
+        self.permutation = permutation
+        self.on_block: Optional[Callable[[int], None]] = None
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def _reserve_block(self, session: AsyncSession) -> None:
+        result = await session.execute(
+            text(
+                "SELECT nextval(:sequence), increment_by FROM pg_sequences "
+                "WHERE schemaname = current_schema() AND sequencename = :sequence"
+            ).bindparams(sequence=self.sequence)
+        )
+        start, block_size = result.one()
+        self._next, self._end = start, min(start + block_size, self.permutation.domain)
+        if self.on_block is not None:
+            self.on_block(start)
+
+    async def allocate_many(self, session: AsyncSession, count: int) -> list[str]:
+        codes = []
+        async with self._lock:
+            while len(codes) < count:
+                if self._next >= self._end:
+                    await self._reserve_block(session)
+                take = min(count - len(codes), self._end - self._next)
+                codes.extend(self.permutation.encode(code_id) for code_id in range(self._next, self._next + take))
+                self._next += take
+        return codes
+
+    async def allocate(self, session: AsyncSession) -> str:
+        return (await self.allocate_many(session, 1))[0]
+
+
+code_permutations = {length: CodePermutation(length, SHORT_CODE_KEY) for length in CODE_SEQUENCES}
+code_allocators = {
+    length: CodeAllocator(sequence, code_permutations[length]) for length, sequence in CODE_SEQUENCES.items()
+}
+
+
+def is_generated_shape(short_code: str) -> bool:
+    """
+    Whether a code has the length and alphabet of generated codes. Custom
+    aliases of this shape are rejected (schemas.LinkCreate): they would take
+    a generated ID, in the registered or an anonymous partition.
+    """
+    return len(short_code) in code_permutations and all(char in ALPHABET for char in short_code.lower())
+
+
+def code_id_of(short_code: str) -> int:
+    """
+    The linkdata partition key of a short code, computed from the code alone
+    so a lookup touches one partition.
+
+    Codes of the generated shapes map to the ID they decode to: 6 characters
+    to [0, ANONYMOUS_ID_START), 10 characters to ANONYMOUS_ID_START and up.
+    Anything else gets a negative ID from a hash of the code; since aliases
+    cannot have a generated shape, that is every alias created since.
+    Aliases from before that decode to the wrong range (10 characters below
+    ANONYMOUS_ID_START) are hashed as well.
+    """
+    short_code = short_code.lower()
+    permutation = code_permutations.get(len(short_code))
+    code_id = permutation.decode(short_code) if permutation else None
+    if code_id is not None and (len(short_code) == 6) == (code_id < ANONYMOUS_ID_START):
+        return code_id
+    digest = hashlib.blake2b(short_code.encode(), digest_size=8).digest()
+    return -1 - (int.from_bytes(digest, "little") >> 1)
@@ -0,0 +1,70 @@
+import re
+from typing import Optional
+from urllib.parse import urlsplit
+
+from redis import asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from src.tinylink.visitors import visitor_hash
+
+
+# One entry per counted redirect: c=short code, t=epoch seconds,
+# r=referrer host, u=user-agent class, v=visitor hash
+CLICK_STREAM = "clicks"
+CLICK_GROUP = "click-aggregator"
+
+_BOT_UA = re.compile(r"bot|crawl|spider|slurp|preview|fetch|curl|wget|python|http", re.IGNORECASE)
+_TABLET_UA = re.compile(r"ipad|tablet|kindle|silk", re.IGNORECASE)
+_MOBILE_UA = re.compile(r"mobi|iphone|ipod|android|phone", re.IGNORECASE)
+
+
+def user_agent_class(user_agent: Optional[str]) -> str:
+    if not user_agent:
+        return "unknown"
+    if _BOT_UA.search(user_agent):
+        return "bot"
+    if _TABLET_UA.search(user_agent):
+        return "tablet"
+    if _MOBILE_UA.search(user_agent):
+        return "mobile"
+    return "desktop"
+
+
+def referrer_host(referrer: Optional[str]) -> str:
+    if not referrer:
+        return ""
+    try:
+        return (urlsplit(referrer).hostname or "")[:255]
+    except ValueError:
+        return ""
+
+
+def click_event(
+    short_code: str, now: float, referrer: Optional[str], user_agent: Optional[str], client_ip: Optional[str]
+) -> dict:
+    return {
+        "c": short_code,
+        "t": f"{now:.3f}",
+        "r": referrer_host(referrer),
+        "u": user_agent_class(user_agent),
+        "v": visitor_hash(client_ip, user_agent),
+    }
+
+
+async def click_stream_stats(redis_client: aioredis.Redis) -> dict:
+    stats = {"length": await redis_client.xlen(CLICK_STREAM), "group": None}
+    try:
+        groups = await redis_client.xinfo_groups(CLICK_STREAM)
+    except ResponseError:
+        # No stream yet, the aggregator creates it with its group
+        return stats
+    for group in groups:
+        if group["name"] == CLICK_GROUP:
+            stats["group"] = {
+                "consumers": group["consumers"],
+                "pending": group["pending"],
+                "last_delivered_id": group["last-delivered-id"],
+                # Undelivered entries, reported by Redis 7+
+                "lag": group.get("lag"),
+            }
+    return stats
@@ -0,0 +1,79 @@
+"""
+Raw ASGI handling of GET /tinylink/link/{short_code}, the hot path.
+
+RedirectFastPath answers redirects before FastAPI routing: no dependency
+resolution, request model or Response object, the reply is two ASGI
+messages. The lookup is the route's (resolve_redirect in
+src/tinylink/router.py), so a database session is only opened on a cache
+miss, and errors carry the same status and {"detail": ...} body.
+"""
+import json
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.redis_client import get_redis_client
+from src.tinylink.router import client_ip, redirect_to_original, resolve_redirect, router
+
+
+REDIRECT_PREFIX = "/tinylink/link/"
+# Characters RedirectResponse leaves unquoted in the Location header
+LOCATION_SAFE = ":/%#?=@[]!$&'()*+,;"
+# Set as scope["route"] like FastAPI routing does, for the middleware
+# outside this one (route labels of src/metrics.py)
+REDIRECT_ROUTE = next(route for route in router.routes if getattr(route, "endpoint", None) is redirect_to_original)
+
+
+class RedirectFastPath:
+    def __init__(self, app: ASGIApp, prefix: str = REDIRECT_PREFIX):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(self.prefix):
+            return await self.app(scope, receive, send)
+        short_code = scope["path"][len(self.prefix):]
+        if not short_code or "/" in short_code:
+            # Not the redirect route, FastAPI answers (404 or another route)
+            return await self.app(scope, receive, send)
+
+        scope["route"] = REDIRECT_ROUTE
+        headers = header_values(scope["headers"], b"referer", b"user-agent", b"x-forwarded-for")
+        client = scope.get("client")
+        ip = client_ip(headers[b"x-forwarded-for"], client[0] if client else None)
+        try:
+            link = await resolve_redirect(
+                short_code, headers[b"referer"], headers[b"user-agent"], ip, get_redis_client()
+            )
+        except HTTPException as exc:
+            body = json.dumps({"detail": exc.detail}, ensure_ascii=False, separators=(",", ":")).encode()
+            await send({
+                "type": "http.response.start",
+                "status": exc.status_code,
+                "headers": [(b"content-length", str(len(body)).encode()), (b"content-type", b"application/json")],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        await send({
+            "type": "http.response.start",
+            "status": 307,
+            "headers": [
+                (b"content-length", b"0"),
+                (b"location", quote(link.original_url, safe=LOCATION_SAFE).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": b""})
+
+
+def header_values(raw_headers: list, *names: bytes) -> dict[bytes, Optional[str]]:
+    """
+    First value of each of the lowercase header names, None if absent.
+    """
+    values = dict.fromkeys(names)
+    for name, value in raw_headers:
+        if name in values and values[name] is None:
+            values[name] = value.decode("latin-1")
+    return values
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError, TimeoutError
+
+from src.metrics import INVALIDATION_LAG
+from src.redis_client import get_redis_client
+from src.tinylink.cache import local_link_cache
+
+
+INVALIDATION_CHANNEL = "link-invalidation"
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationStats:
+    """
+    Per-worker counters for the invalidation bus, lag is publish -> receive.
+    The lag is also observed into INVALIDATION_LAG, summed over the workers.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self.received = 0
+        self.resubscribes = 0
+        self.last_lag = None
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    def observe_lag(self, lag: float) -> None:
+        self.received += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.total_lag += lag
+        INVALIDATION_LAG.observe(lag)
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "received": self.received,
+            "resubscribes": self.resubscribes,
+            "lag_last_ms": round(self.last_lag * 1000, 3) if self.last_lag is not None else None,
+            "lag_max_ms": round(self.max_lag * 1000, 3),
+            "lag_avg_ms": round(self.total_lag / self.received * 1000, 3) if self.received else None,
+        }
+
+
+invalidation_stats = InvalidationStats()
+
+_listener_task: Optional[asyncio.Task] = None
+
+
+async def publish_invalidation(redis_client: aioredis.Redis, *short_codes: str) -> None:
+    """
+    Tells every worker to drop the given short codes from its local cache.
+    """
+    for short_code in short_codes:
+        local_link_cache.invalidate(short_code)
+    message = json.dumps({"codes": list(short_codes), "ts": time.time(), "pid": os.getpid()})
+    await redis_client.publish(INVALIDATION_CHANNEL, message)
+    invalidation_stats.published += 1
+
+
+def handle_invalidation(data: str) -> None:
+    message = json.loads(data)
+    for short_code in message["codes"]:
+        local_link_cache.invalidate(short_code)
+    invalidation_stats.observe_lag(max(time.time() - message["ts"], 0.0))
+
+
+async def listen_for_invalidations() -> None:
+    """
+    Subscribes to the invalidation channel and applies messages to the local
+    cache, reconnecting on errors. Pub/sub is at-most-once, so the whole local
+    cache is cleared whenever a (re)subscription is confirmed.
+    """
+    while True:
+        pubsub = get_redis_client().pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            while True:
+                message = await pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                if message["type"] == "subscribe":
+                    local_link_cache.clear()
+                    invalidation_stats.resubscribes += 1
+                elif message["type"] == "message":
+                    handle_invalidation(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except (ConnectionError, TimeoutError) as e:
+            logger.warning("Invalidation listener disconnected: %s", e)
+            await asyncio.sleep(1)
+        except Exception:
+            logger.exception("Invalidation listener failed")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+
+def start_invalidation_listener() -> asyncio.Task:
+    global _listener_task
+    _listener_task = asyncio.create_task(listen_for_invalidations())
+    return _listener_task
+
+
+async def stop_invalidation_listener() -> None:
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
@@ -0,0 +1,105 @@
+import time
+
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.config import TOP_LINKS_CACHE_TTL
+from src.tinylink.codes import code_id_of
+from src.tinylink.models import linkdata
+
+
+# Sorted set per time slot, short code -> clicks, filled by the click
+# aggregator: top:{resolution}:{slot}, slot = epoch // resolution
+TOP_SLOT_KEY = "top:{resolution}:{slot}"
+# Union of a window's slots, shared by the workers for TOP_LINKS_CACHE_TTL
+TOP_WINDOW_KEY = "top:window:{window}"
+# window -> (slot seconds, slots before the current one). A window covers
+# its length plus the part of the current slot that has elapsed.
+TOP_WINDOWS = {
+    "hour": (5 * 60, 12),
+    "day": (60 * 60, 24),
+}
+TOP_LINKS_MAX = 100
+# Every slot resolution is a multiple of this one
+TOP_SLOT_SECONDS = min(resolution for resolution, _ in TOP_WINDOWS.values())
+
+# Rebuilds the window union when it has expired, then reads the top of it.
+# KEYS: window key, slot keys; ARGV: ttl, n
+TOP_WINDOW_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local slots = {}
+    for i = 2, #KEYS do
+        slots[#slots + 1] = KEYS[i]
+    end
+    redis.call('ZUNIONSTORE', KEYS[1], #slots, unpack(slots))
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return redis.call('ZREVRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1, 'WITHSCORES')
+"""
+
+_responses: dict[tuple[str, int], tuple[float, list]] = {}
+
+
+def slot_keys(window: str, now: float) -> list[str]:
+    resolution, slots = TOP_WINDOWS[window]
+    current = int(now // resolution)
+    return [TOP_SLOT_KEY.format(resolution=resolution, slot=slot) for slot in range(current - slots, current + 1)]
+
+
+def top_slot_of(clicked_at: float) -> int:
+    return int(clicked_at // TOP_SLOT_SECONDS) * TOP_SLOT_SECONDS
+
+
+def count_top_clicks(pipe: Pipeline, clicks: dict) -> None:
+    """
+    Queues the ZINCRBYs for {(short_code, top_slot_of(clicked_at)): clicks}.
+    Slots expire once they are out of their window.
+    """
+    slots = {}
+    for (short_code, clicked_at), count in clicks.items():
+        for resolution, window_slots in TOP_WINDOWS.values():
+            key = TOP_SLOT_KEY.format(resolution=resolution, slot=int(clicked_at // resolution))
+            slots[key] = (window_slots + 1) * resolution
+            pipe.zincrby(key, count, short_code)
+    for key, ttl in slots.items():
+        pipe.expire(key, ttl)
+
+
+async def ranked_codes(redis_client: aioredis.Redis, window: str, count: int) -> list[tuple[str, float]]:
+    """
+    The count most clicked short codes of the window with their clicks.
+    """
+    keys = [TOP_WINDOW_KEY.format(window=window)] + slot_keys(window, time.time())
+    ranked = await redis_client.eval(TOP_WINDOW_LUA, len(keys), *keys, TOP_LINKS_CACHE_TTL, count)
+    return list(zip(ranked[::2], ranked[1::2]))
+
+
+async def top_links(session: AsyncSession, redis_client: aioredis.Redis, window: str, n: int) -> list[dict]:
+    """
+    Most clicked links of the window, cached per worker for TOP_LINKS_CACHE_TTL.
+    """
+    cached = _responses.get((window, n))
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    # Twice as many as asked for, links deleted or deactivated since are skipped
+    ranked = await ranked_codes(redis_client, window, 2 * n)
+
+    links = {}
+    if ranked:
+        result = await session.execute(
+            select(linkdata.c.short_code, linkdata.c.original_url).where(
+                linkdata.c.code_id.in_([code_id_of(code) for code, _ in ranked]),
+                linkdata.c.is_active == True,
+            )
+        )
+        links = {row.short_code.lower(): row for row in result}
+
+    top = [
+        {"short_code": links[code].short_code, "original_url": links[code].original_url, "clicks": int(float(clicks))}
+        for code, clicks in ranked if code in links
+    ][:n]
+    _responses[(window, n)] = (time.monotonic() + TOP_LINKS_CACHE_TTL, top)
+    return top
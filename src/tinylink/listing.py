@@ -0,0 +1,113 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Optional, Union
+
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Column, DateTime, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.sql import Select
+
+from src.tinylink.models import linkdata
+from src.tinylink.schemas import LinkResponse
+
+
+LISTING_PAGE_SIZE = 100
+LISTING_MAX_PAGE_SIZE = 1000
+# Rows fetched per round trip from the server-side cursor in stream mode
+LISTING_STREAM_FETCH_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Sort keys of each listing, unique so that every row has its own position
+EXPIRED_KEYS = (linkdata.c.expires_at, linkdata.c.id)
+CREATED_KEYS = (linkdata.c.created, linkdata.c.id)
+
+
+def encode_cursor(row, keys: tuple[Column, ...]) -> str:
+    position = [getattr(row, key.name) for key in keys]
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else str(value) for value in position])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, keys: tuple[Column, ...]) -> list:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if (
+            not isinstance(payload, list) or len(payload) != len(keys)
+            or not all(isinstance(value, str) for value in payload)
+        ):
+            raise ValueError(cursor)
+        return [
+            datetime.fromisoformat(value) if isinstance(key.type, DateTime) else uuid.UUID(value)
+            for key, value in zip(keys, payload)
+        ]
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset(stmt: Select, keys: tuple[Column, ...], cursor: Optional[str]) -> Select:
+    """
+    Orders stmt by keys and starts it after the cursor position: a range scan
+    of the matching index instead of an OFFSET that reads the skipped rows.
+    """
+    if cursor:
+        stmt = stmt.where(tuple_(*keys) > tuple_(*decode_cursor(cursor, keys)))
+    return stmt.order_by(*keys)
+
+
+def link_response(row) -> LinkResponse:
+    return LinkResponse(
+        short_code=row.short_code,
+        original_url=row.original_url,
+        expires_at=row.expires_at,
+        user_id=row.user_id,
+    )
+
+
+async def fetch_page(
+    session: AsyncSession, stmt: Select, keys: tuple[Column, ...], limit: int
+) -> tuple[list[LinkResponse], Optional[str]]:
+    """
+    One page of a keyset() statement and the cursor of the next one (None on
+    the last page).
+    """
+    rows = (await session.execute(stmt.limit(limit + 1))).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1], keys) if len(rows) > limit else None
+    return [link_response(row) for row in rows[:limit]], next_cursor
+
+
+async def stream_links(session_maker: async_sessionmaker, stmt: Select) -> AsyncIterator[str]:
+    """
+    NDJSON, one link per line, of a keyset() statement read through a
+    server-side cursor so only LISTING_STREAM_FETCH_SIZE rows are held at a time.
+    """
+    async with session_maker() as session:
+        result = await session.stream(stmt.execution_options(yield_per=LISTING_STREAM_FETCH_SIZE))
+        async for partition in result.partitions():
+            yield "".join(link_response(row).model_dump_json() + "\n" for row in partition)
+
+
+async def list_links(
+    session: AsyncSession,
+    session_maker: async_sessionmaker,
+    response: Response,
+    stmt: Select,
+    keys: tuple[Column, ...],
+    cursor: Optional[str],
+    limit: int,
+    stream: bool,
+) -> Union[list[LinkResponse], StreamingResponse]:
+    """
+    A page of links with the next cursor in the NEXT_CURSOR_HEADER header,
+    or with stream every link from the cursor on as NDJSON.
+    """
+    stmt = keyset(stmt, keys, cursor)
+    if stream:
+        return StreamingResponse(stream_links(session_maker, stmt), media_type="application/x-ndjson")
+    links, next_cursor = await fetch_page(session, stmt, keys, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return links
@@ -1,15 +1,22 @@
-from sqlalchemy import Table, Column, Integer, DateTime, MetaData, String, Boolean
+from sqlalchemy import Table, Column, Integer, BigInteger, Date, DateTime, MetaData, String, Boolean, Index, LargeBinary, and_
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import func
+import hashlib
 import uuid
 
+from src.tinylink.codes import code_id_of
+
 
 metadata = MetaData()
+UNIQUE_VIOLATION = "23505"
 
 linkdata = Table(
     "linkdata",
     metadata,
-    Column("id", UUID(as_uuid=True), primary_key=True, default=uuid.uuid4),
+    # Derived from short_code (src/tinylink/codes.py:code_id_of), partition key
+    Column("code_id", BigInteger, primary_key=True, autoincrement=False),
+    Column("id", UUID(as_uuid=True), nullable=False, default=uuid.uuid4),
     Column("user_id", UUID, nullable=True),
     Column("original_url", String),
     Column("short_code", String),
@@ -17,5 +24,112 @@ linkdata = Table(
     Column("expires_at", DateTime, default=func.now(), nullable=False),
     Column("usage_count", Integer, default=0, nullable=False),
     Column("last_used_at", DateTime, nullable=True),
-    Column("is_active", Boolean, default=True)
+    Column("is_active", Boolean, default=True),
+    # md5(original_url), fixed-width key for dedupe and search by URL
+    Column("url_digest", LargeBinary(16), nullable=True),
+    # Range partitions on code_id (src/tinylink/partitions.py): custom aliases,
+    # registered links, anonymous links in blocks of IDs allocated in order,
+    # so a block expires as a whole and is dropped
+    postgresql_partition_by="RANGE (code_id)",
+)
+
+# Keyset pagination: /links/mine by (created, id), /links/expired by (expires_at, id)
+Index("ix_linkdata_user_id_created", linkdata.c.user_id, linkdata.c.created, linkdata.c.id)
+Index(
+    "ix_linkdata_active_expires_at_id",
+    linkdata.c.expires_at,
+    linkdata.c.id,
+    postgresql_where=linkdata.c.is_active == True,
+)
+Index("ix_linkdata_active_last_used_at", linkdata.c.last_used_at, postgresql_where=linkdata.c.is_active == True)
+Index("ix_linkdata_active_url_digest", linkdata.c.url_digest, postgresql_where=linkdata.c.is_active == True)
+Index(
+    "ix_linkdata_active_unused_created",
+    linkdata.c.created,
+    postgresql_where=(linkdata.c.is_active == True) & linkdata.c.last_used_at.is_(None),
+)
+
+# Clicks per link and hour, rolled up from Redis by the click aggregator.
+# Partitioned by month (link_clicks_hourly_pYYYYMM) so old months are dropped
+# instead of deleted row by row.
+link_clicks_hourly = Table(
+    "link_clicks_hourly",
+    metadata,
+    Column("short_code", String, primary_key=True),  # lowercase
+    Column("bucket", DateTime, primary_key=True),  # start of the hour, UTC
+    Column("clicks", BigInteger, nullable=False),
+    postgresql_partition_by="RANGE (bucket)",
+)
+
+# HyperLogLog sketches of visitor hashes per link, persisted from Redis for
+# the day, month and all-time ("all", period_start 1970-01-01) windows
+link_unique_visitors = Table(
+    "link_unique_visitors",
+    metadata,
+    Column("short_code", String, primary_key=True),  # lowercase
+    Column("period", String(5), primary_key=True),
+    Column("period_start", Date, primary_key=True),
+    Column("sketch", LargeBinary, nullable=False),
+    Column("estimate", BigInteger, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+Index("ix_link_unique_visitors_period_start", link_unique_visitors.c.period_start)
+
+
+# Hourly hashes already added to link_clicks_hourly, recorded in the same
+# transaction (src/tinylink/analytics.py:rollup_click_buckets)
+link_click_rollups = Table(
+    "link_click_rollups",
+    metadata,
+    Column("rollup_id", String, primary_key=True),
+    Column("bucket", DateTime, nullable=False),
+    Column("rolled_up_at", DateTime, nullable=False),
 )
+
+
+# Last click stream entry ID ("ms-seq") applied to linkdata per aggregator
+# consumer, committed with the counters (src/tasks/aggregator.py)
+click_stream_offsets = Table(
+    "click_stream_offsets",
+    metadata,
+    Column("consumer", String, primary_key=True),
+    Column("last_id", String, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+
+def short_code_matches(short_code: str):
+    """
+    Case-insensitive short code filter: one primary key probe in the one
+    partition the code maps to.
+    """
+    return and_(linkdata.c.code_id == code_id_of(short_code), func.lower(linkdata.c.short_code) == short_code.lower())
+
+
+def url_digest(original_url: str) -> bytes:
+    """
+    Same value as decode(md5(original_url), 'hex') in PostgreSQL.
+    """
+    return hashlib.md5(original_url.encode()).digest()
+
+
+def original_url_matches(original_url: str):
+    """
+    Exact URL filter served by ix_linkdata_active_url_digest, the URL itself
+    is compared as well to rule out digest collisions.
+    """
+    return and_(linkdata.c.url_digest == url_digest(original_url), linkdata.c.original_url == original_url)
+
+
+def is_code_conflict(error: IntegrityError) -> bool:
+    """
+    Whether an INSERT failed on the linkdata primary key (code_id), that is
+    on a short code that is already taken. PostgreSQL names the key of the
+    partition, linkdata_registered_pkey for instance.
+    """
+    constraint = getattr(error.orig.__cause__, "constraint_name", None) or ""
+    return (
+        getattr(error.orig, "sqlstate", None) == UNIQUE_VIOLATION
+        and constraint.startswith("linkdata")
+        and constraint.endswith("_pkey")
+    )
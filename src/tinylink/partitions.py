@@ -0,0 +1,259 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from redis import asyncio as aioredis
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.config import ANONYMOUS_PARTITION_IDS, MAINTENANCE_BATCH_SIZE
+from src.tasks.maintenance import evict_links
+from src.tinylink.codes import ALPHABET, ANONYMOUS_ID_START, CODE_SEQUENCES
+from src.tinylink.models import linkdata
+
+
+# linkdata is range partitioned on code_id (src/tinylink/codes.py:code_id_of):
+#   linkdata_aliases              custom aliases, negative IDs
+#   linkdata_registered           registered links, [0, ANONYMOUS_ID_START)
+#   linkdata_anonymous_pNNNNNN    anonymous links, ANONYMOUS_PARTITION_IDS each
+#   linkdata_default              anything else: anonymous codes from before
+#                                 the allocator, IDs past the created partitions
+# Anonymous IDs come from one sequence, so a partition holds the links of
+# one stretch of time and is dropped once all of them have expired.
+ANONYMOUS_ID_END = len(ALPHABET) ** 10
+DEFAULT_PARTITION = "linkdata_default"
+# Anonymous partitions created ahead of the sequence
+PARTITIONS_AHEAD = 2
+# pg_advisory_xact_lock key: one partition is created or dropped at a time,
+# by the Celery task or an API worker (PartitionsAhead)
+PARTITION_LOCK_KEY = 0x6C696E6B64617461
+
+logger = logging.getLogger(__name__)
+
+
+def anonymous_partition_index(code_id: int) -> int:
+    return (code_id - ANONYMOUS_ID_START) // ANONYMOUS_PARTITION_IDS
+
+
+def anonymous_partition_name(index: int) -> str:
+    return f"linkdata_anonymous_p{index:06d}"
+
+
+def anonymous_partition_bounds(index: int) -> tuple[int, int]:
+    start = ANONYMOUS_ID_START + index * ANONYMOUS_PARTITION_IDS
+    return start, min(start + ANONYMOUS_PARTITION_IDS, ANONYMOUS_ID_END)
+
+
+async def anonymous_sequence_position(session: AsyncSession) -> int:
+    """
+    The start of the last block of IDs handed out to a worker.
+    """
+    result = await session.execute(
+        text(
+            "SELECT last_value FROM pg_sequences "
+            "WHERE schemaname = current_schema() AND sequencename = :sequence"
+        ).bindparams(sequence=CODE_SEQUENCES[10])
+    )
+    return result.scalar() or ANONYMOUS_ID_START
+
+
+async def anonymous_partitions(session: AsyncSession) -> dict[int, str]:
+    result = await session.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'linkdata' AND child.relname LIKE 'linkdata_anonymous_p%'"
+    ))
+    return {int(name.rsplit("_p", 1)[1]): name for name in result.scalars()}
+
+
+async def partition_lock(session: AsyncSession) -> bool:
+    """
+    Takes the partition lock for the current transaction, False if another
+    one holds it.
+    """
+    result = await session.execute(text("SELECT pg_try_advisory_xact_lock(:key)").bindparams(key=PARTITION_LOCK_KEY))
+    return result.scalar()
+
+
+async def create_anonymous_partition(session: AsyncSession, index: int) -> None:
+    """
+    CREATE TABLE ... PARTITION OF locks linkdata exclusively while it scans
+    linkdata_default, and fails if the default partition holds rows of the
+    range. Instead the partition is built as a standalone table, takes those
+    rows over and is attached: linkdata stays readable and writable, only
+    linkdata_default is locked until the commit.
+    """
+    name = anonymous_partition_name(index)
+    start, end = anonymous_partition_bounds(index)
+    columns = ", ".join(linkdata.c.keys())
+    # In ATTACH's order, so that nothing can add rows of the range meanwhile
+    await session.execute(text("LOCK TABLE ONLY linkdata IN SHARE UPDATE EXCLUSIVE MODE"))
+    await session.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE"))
+    await session.execute(text(f"CREATE TABLE {name} (LIKE linkdata INCLUDING DEFAULTS)"))
+    moved = await session.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE code_id >= :start AND code_id < :end "
+            f"RETURNING {columns}) INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+        ).bindparams(start=start, end=end)
+    )
+    await session.execute(text(f"ALTER TABLE linkdata ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})"))
+    if moved.rowcount:
+        logger.info("Moved %s links from %s to %s", moved.rowcount, DEFAULT_PARTITION, name)
+
+
+async def ensure_link_partitions(session: AsyncSession) -> list[str]:
+    """
+    Creates the anonymous partitions for the sequence's current block and the
+    PARTITIONS_AHEAD after it, each in its own transaction. Stops when
+    another run holds the partition lock.
+    """
+    current = anonymous_partition_index(await anonymous_sequence_position(session))
+    created = []
+    for index in range(current, current + PARTITIONS_AHEAD + 1):
+        if not await partition_lock(session):
+            break
+        if index not in await anonymous_partitions(session):
+            await create_anonymous_partition(session, index)
+            created.append(anonymous_partition_name(index))
+        await session.commit()
+    await session.commit()
+    return created
+
+
+class PartitionsAhead:
+    """
+    Block listener of the anonymous code allocator (CodeAllocator.on_block):
+    the first block a worker reserves in a partition creates the partitions
+    ahead in the background, so they exist before the sequence gets there
+    even when beat is down or a bulk import goes through blocks quickly.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker):
+        self.session_maker = session_maker
+        self.index: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def __call__(self, block_start: int) -> None:
+        index = anonymous_partition_index(block_start)
+        if index == self.index or (self.task is not None and not self.task.done()):
+            return
+        self.index = index
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self) -> None:
+        try:
+            async with self.session_maker() as session:
+                created = await ensure_link_partitions(session)
+            if created:
+                logger.info("Link partitions created ahead of the sequence: %s", created)
+        except Exception:
+            # The next partition reached or the Celery task tries again
+            self.index = None
+            logger.exception("Could not create the link partitions ahead of the sequence")
+
+
+async def evict_partition_links(session: AsyncSession, redis_client: aioredis.Redis, name: str) -> None:
+    """
+    Drops the links of a partition from the Redis and worker caches, in
+    batches of MAINTENANCE_BATCH_SIZE.
+    """
+    after = -1
+    while True:
+        result = await session.execute(
+            text(
+                f"SELECT code_id, short_code, url_digest FROM {name} "
+                f"WHERE code_id > :after ORDER BY code_id LIMIT :limit"
+            ).bindparams(after=after, limit=MAINTENANCE_BATCH_SIZE)
+        )
+        rows = result.fetchall()
+        if not rows:
+            return
+        await evict_links(redis_client, rows)
+        after = rows[-1].code_id
+
+
+async def drop_expired_link_partitions(session: AsyncSession, redis_client: aioredis.Redis) -> list[str]:
+    """
+    Retention: detaches and drops the anonymous partitions behind the
+    sequence whose links have all expired, once their links are evicted
+    from the caches. A worker still holding a block in a dropped partition
+    inserts into linkdata_default.
+    """
+    current = anonymous_partition_index(await anonymous_sequence_position(session))
+    now = datetime.utcnow()
+    dropped = []
+    for index, name in sorted((await anonymous_partitions(session)).items()):
+        if index >= current:
+            break
+        # Aliases of registered users from before aliases were kept out of
+        # the anonymous ranges hold their partition
+        live = await session.execute(
+            text(f"SELECT 1 FROM {name} WHERE expires_at >= :now OR user_id IS NOT NULL LIMIT 1").bindparams(now=now)
+        )
+        if live.first():
+            continue
+        if not await partition_lock(session):
+            break
+        await evict_partition_links(session, redis_client, name)
+        # DETACH ... CONCURRENTLY needs PostgreSQL 14, production runs 13
+        await session.execute(text(f"ALTER TABLE linkdata DETACH PARTITION {name}"))
+        await session.execute(text(f"DROP TABLE {name}"))
+        await session.commit()
+        dropped.append(name)
+    return dropped
+
+
+async def purge_expired_default_rows(session: AsyncSession, redis_client: aioredis.Redis) -> int:
+    """
+    Deletes expired anonymous links from linkdata_default in batches and
+    evicts them from the caches: the only rows that are not removed with a
+    whole partition. Links of registered users are deactivated instead
+    (src/tasks/maintenance.py).
+    """
+    purged = 0
+    while True:
+        result = await session.execute(
+            text(
+                f"DELETE FROM {DEFAULT_PARTITION} WHERE code_id IN ("
+                f"SELECT code_id FROM {DEFAULT_PARTITION} WHERE expires_at < :now AND user_id IS NULL "
+                f"LIMIT :limit FOR UPDATE SKIP LOCKED) RETURNING short_code, url_digest"
+            ).bindparams(now=datetime.utcnow(), limit=MAINTENANCE_BATCH_SIZE)
+        )
+        rows = result.fetchall()
+        await session.commit()
+        if not rows:
+            return purged
+        await evict_links(redis_client, rows)
+        purged += len(rows)
+
+
+async def maintain_link_partitions(session: AsyncSession, redis_client: aioredis.Redis) -> dict:
+    """
+    Creation and retention fail independently: a partition that cannot be
+    created does not stop the expired ones from being dropped. Raises once
+    all steps ran if any of them failed.
+    """
+    steps = {
+        "created": lambda: ensure_link_partitions(session),
+        "dropped": lambda: drop_expired_link_partitions(session, redis_client),
+        "purged": lambda: purge_expired_default_rows(session, redis_client),
+    }
+    results = {}
+    failed = []
+    for step, run in steps.items():
+        try:
+            results[step] = await run()
+        except Exception:
+            logger.exception("Link partition maintenance failed: %s", step)
+            await session.rollback()
+            failed.append(step)
+    if results.get("created") or results.get("dropped") or results.get("purged"):
+        logger.info(
+            "Link partitions created: %s, dropped: %s, expired default rows purged: %s",
+            results.get("created") or "none", results.get("dropped") or "none", results.get("purged", 0),
+        )
+    if failed:
+        raise RuntimeError(f"Link partition maintenance failed: {', '.join(failed)}")
+    return results
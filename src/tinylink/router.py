@@ -1,25 +1,44 @@
-import redis
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import RedirectResponse
+import asyncio
+import os
+import time
+import uuid
+from redis import asyncio as aioredis
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import insert, delete, update, text
+from sqlalchemy import insert, delete, update
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 from typing import List, Optional
 from src.auth.users import current_active_user
-from src.database import get_async_session
+from src.database import async_session_maker, get_async_session
+from src.redis_client import get_redis
 from src.tinylink.schemas import LinkResponse, LinkCreate, LinkUpdate
-from src.tinylink.models import linkdata
+from src.tinylink.models import is_code_conflict, linkdata, original_url_matches, short_code_matches, url_digest
+from src.tinylink import scripts
+from src.tinylink.scripts import RELEASE_LOCK_LUA
+from src.tinylink.cache import (
+    CachedLink, cache_link, link_loads, local_link_cache, negative_cache_key, remember_url, remembered_url, to_epoch,
+    url_digest_key,
+)
+from src.tinylink.batch import resolve_expires_at, shorten_batch, spool_request_body
+from src.tinylink.codes import SHORT_CODE_ATTEMPTS, code_allocators, code_id_of
+from src.tinylink.bloom import BLOOM_KEY, BLOOM_READY_KEY, add_to_bloom, bloom_positions, bloom_stats
+from src.tinylink.invalidation import invalidation_stats, publish_invalidation
+from src.tinylink.analytics import GRANULARITIES, click_series, parse_range
+from src.tinylink.visitors import unique_visitors
+from src.tinylink.events import CLICK_STREAM, click_event, click_stream_stats
+from src.tinylink.listing import (
+    CREATED_KEYS, EXPIRED_KEYS, LISTING_MAX_PAGE_SIZE, LISTING_PAGE_SIZE, NEXT_CURSOR_HEADER, list_links,
+)
+from src.tasks.maintenance import run_deactivation_jobs
+from src.tinylink.leaderboard import TOP_LINKS_MAX, TOP_WINDOWS, top_links
+from src.metrics import REDIRECT_LOOKUPS
 from src.auth.db import User
 from urllib.parse import unquote
 from fastapi import Query
-from datetime import timedelta
-from src.config import  DEACTIVATION_DAYS
-from sqlalchemy import func
-
-
-# Настройка Redis
-redis_client = redis.StrictRedis(host='redis_app', port=6379, db=0, decode_responses=True)
+from src.config import  NEGATIVE_CACHE_TTL, LINK_LOAD_LOCK_MS
 
 router = APIRouter(
     prefix="/tinylink",
@@ -30,132 +49,262 @@ router = APIRouter(
 async def shorten_link(
     link: LinkCreate,
     session: AsyncSession = Depends(get_async_session),
-    user: Optional[User] = Depends(current_active_user)
+    user: Optional[User] = Depends(current_active_user),
+    redis_client: aioredis.Redis = Depends(get_redis)
 ):
     user_id = user.id if user else None
     code_length = 10 if user_id is None else 6
 
     # Check if custom_alias is provided and not already taken
     if link.custom_alias:
-        if redis_client.exists(f"link:{link.custom_alias}"):
+        result = await session.execute(select(linkdata.c.id).where(short_code_matches(link.custom_alias)))
+        if result.first():
             raise HTTPException(status_code=400, detail="Custom alias already taken")
 
-    # Check if the original URL already exists in the database
+    # Check if the original URL is already shortened: Redis first, then the
+    # digest index in the database
+    digest = url_digest(link.original_url)
+    existing = remembered_url(await redis_client.get(url_digest_key(digest)), time.time())
+    if existing:
+        return LinkResponse(
+            short_code=existing["short_code"],
+            original_url=link.original_url,
+            user_id=existing["user_id"]
+        )
+
+    # Expired anonymous links stay active until their partition is dropped
     result = await session.execute(
-        select(linkdata).where(linkdata.c.original_url == link.original_url, linkdata.c.is_active == True)
+        select(linkdata).where(
+            original_url_matches(link.original_url),
+            linkdata.c.is_active == True,
+            linkdata.c.expires_at > datetime.utcnow(),
+        )
     )
     existing_link = result.fetchone()
 
     if existing_link:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            remember_url(pipe, digest, existing_link.short_code, existing_link.user_id, existing_link.expires_at)
+            await pipe.execute()
         return LinkResponse(
             short_code=existing_link.short_code,
             original_url=existing_link.original_url,
             user_id=existing_link.user_id
         )
 
-    # Generate a unique short code using the PostgreSQL function
-    if link.custom_alias:
-        short_code = link.custom_alias
-    else:
-        result = await session.execute(
-            text("SELECT generate_unique_short_code(:length)").bindparams(length=code_length)
-        )
-        short_code = result.scalar()
-
-    # Устанавливаем expires_at, если пользователь не залогинен (по умолчанию 1 неделя)
-    if user_id is None:
-        expires_at = datetime.utcnow() + timedelta(weeks=1)
-    else:
-        expires_at = link.expires_at
-
-    if isinstance(expires_at, str):
-        expires_at = datetime.strptime(expires_at, '%Y-%m-%d %H:%M:%S.%f')
-
-    # Проверяем, что expires_at не истек
-    if expires_at is not None and expires_at < datetime.utcnow():
-        raise HTTPException(status_code=400, detail="Expiration date cannot be in the past")
+    expires_at = resolve_expires_at(link, user_id)
 
     insert_data = {
         "original_url": link.original_url,
-        "short_code": short_code,
+        "url_digest": digest,
         "user_id": user_id,
         "expires_at": expires_at  # Записываем срок действия в БД
     }
 
-    stmt = insert(linkdata).values(insert_data)
-    await session.execute(stmt)
-    await session.commit()
+    for _ in range(SHORT_CODE_ATTEMPTS):
+        # Generated codes come from the worker's reserved block, no query needed
+        short_code = link.custom_alias or await code_allocators[code_length].allocate(session)
+        try:
+            await session.execute(
+                insert(linkdata).values(insert_data | {"short_code": short_code, "code_id": code_id_of(short_code)})
+            )
+            await session.commit()
+            break
+        except IntegrityError as e:
+            # Primary key (code_id): alias taken by a concurrent request, or
+            # a generated code that matches a custom alias or a legacy random code
+            await session.rollback()
+            if not is_code_conflict(e):
+                raise
+            if link.custom_alias:
+                raise HTTPException(status_code=400, detail="Custom alias already taken")
+    else:
+        raise HTTPException(status_code=503, detail="Could not allocate a short code")
 
-    # Cache the link in Redis
-    redis_client.setex(f"link:{short_code}", 3600, link.original_url)
-    redis_client.zadd("usage_count", {short_code: 0})
+    # Cache the link in Redis, keys use the lowercase code
+    code_key = short_code.lower()
+    async with redis_client.pipeline(transaction=False) as pipe:
+        cache_link(pipe, code_key, CachedLink(link.original_url, to_epoch(expires_at), True))
+        pipe.delete(negative_cache_key(code_key))
+        add_to_bloom(pipe, code_key)
+        remember_url(pipe, digest, short_code, user_id, expires_at)
+        await pipe.execute()
 
     return LinkResponse(short_code=short_code, original_url=link.original_url, user_id=user_id, expires_at=expires_at)
 
 
+@router.post("/links/shorten/batch")
+async def shorten_links_batch(
+    request: Request,
+    user: Optional[User] = Depends(current_active_user),
+    redis_client: aioredis.Redis = Depends(get_redis)
+):
+    """
+    Shortens a JSON array or NDJSON of links (LinkCreate objects or plain URL
+    strings). Streams back one NDJSON line per item in input order, either the
+    link or {"index", "error"}.
+    """
+    user_id = user.id if user else None
+    body = await spool_request_body(request)
+    return StreamingResponse(
+        shorten_batch(body, user_id, async_session_maker, redis_client), media_type="application/x-ndjson"
+    )
+
+
 @router.get("/link/{short_code}")
-async def redirect_to_original(short_code: str, session: AsyncSession = Depends(get_async_session)):
-    cached_url = redis_client.get(f"link:{short_code}")
-    if cached_url:
-        # Retrieve usage_count from Redis and increment it
-        usage_count = redis_client.zscore("usage_count", short_code)
-        if usage_count is None:
-            # Fetch from DB if not in Redis
-            result = await session.execute(
-                select(linkdata.c.usage_count).where(func.lower(linkdata.c.short_code) == func.lower(short_code), linkdata.c.is_active == True)
-            )
-            db_usage_count = result.scalar() or 0
-            redis_client.zadd("usage_count", {short_code: db_usage_count})
+async def redirect_to_original(
+        short_code: str,
+        request: Request,
+        redis_client: aioredis.Redis = Depends(get_redis)
+):
+    """
+    Requests to this route are answered by RedirectFastPath
+    (src/tinylink/fastpath.py) before FastAPI routing, the route is kept for
+    the schema and for apps mounted without the middleware.
+    """
+    ip = client_ip(request.headers.get("x-forwarded-for"), request.client.host if request.client else None)
+    link = await resolve_redirect(
+        short_code, request.headers.get("referer"), request.headers.get("user-agent"), ip, redis_client
+    )
+    return RedirectResponse(url=link.original_url)
+
+
+async def resolve_redirect(
+    short_code: str,
+    referer: Optional[str],
+    user_agent: Optional[str],
+    ip: Optional[str],
+    redis_client: aioredis.Redis,
+) -> CachedLink:
+    """
+    Looks the link up and records the click. Raises HTTPException when the
+    link is unknown (404), expired (410) or deactivated (403). A database
+    session is only opened on a miss in both cache levels.
+    """
+    # Short codes are case-insensitive, caches are keyed by the lowercase form
+    short_code = short_code.lower()
+    now = time.time()
+    # Clicks are only recorded as stream events, the aggregator
+    # (src/tasks/aggregator.py) writes them to the database
+    event = click_event(short_code, now, referer, user_agent, ip)
+
+    link = local_link_cache.get(short_code)
+    if link is not None:
+        REDIRECT_LOOKUPS.labels("l1_hit").inc()
+    else:
+        # Lookup and click event in a single round-trip, unknown codes are
+        # rejected by the negative cache or the bloom filter
+        cached = await scripts.redirect_script(
+            keys=[f"link:{short_code}", CLICK_STREAM, negative_cache_key(short_code), BLOOM_KEY, BLOOM_READY_KEY],
+            args=[short_code, event["t"], event["r"], event["u"], event["v"]]
+            + bloom_positions(short_code),
+            client=redis_client,
+        )
+        if cached == scripts.DEFINITE_MISS:
+            REDIRECT_LOOKUPS.labels("rejected").inc()
+            raise HTTPException(status_code=404, detail="Link not found")
+        if cached:
+            REDIRECT_LOOKUPS.labels("redis_hit").inc()
+            link = CachedLink.from_redis(*cached)
+            local_link_cache.set(short_code, link)
+            check_link_state(link, now)
+            return link
+
+        # Cache miss: one load per code and worker, concurrent requests wait for it
+        REDIRECT_LOOKUPS.labels("miss").inc()
+        link = await link_loads.do(short_code, lambda: load_link(short_code, redis_client))
+        if link is None:
+            raise HTTPException(status_code=404, detail="Link not found")
+        local_link_cache.set(short_code, link)
+
+    check_link_state(link, now)
+    await redis_client.xadd(CLICK_STREAM, event)
+    return link
+
+
+async def load_link(short_code: str, redis_client: aioredis.Redis) -> Optional[CachedLink]:
+    """
+    Resolves a cache miss from the database and repopulates Redis.
+    With LINK_LOAD_LOCK_MS the other workers wait for the lock holder to fill
+    the cache instead of querying the database for the same code.
+    Clicks are not written here, the caller emits the click event.
+    """
+    lock_key = f"lock:link:{short_code}"
+    lock_token = uuid.uuid4().hex
+    if LINK_LOAD_LOCK_MS and not await redis_client.set(lock_key, lock_token, nx=True, px=LINK_LOAD_LOCK_MS):
+        deadline = time.monotonic() + LINK_LOAD_LOCK_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hmget(f"link:{short_code}", "url", "exp", "active")
+                pipe.exists(negative_cache_key(short_code))
+                cached, missing = await pipe.execute()
+            if cached[0] is not None:
+                return CachedLink.from_redis(*cached)
+            if missing:
+                return None
+        # The lock holder did not finish in time, load it ourselves
+
+    try:
+        async with async_session_maker() as session:
+            # Deactivated rows are cached too so that repeated hits are
+            # answered with 403 without touching linkdata
+            result = await session.execute(select(linkdata).where(short_code_matches(short_code)))
+            link = result.fetchone()
 
-        redis_client.zincrby("usage_count", 1, short_code)
+        if not link:
+            await redis_client.set(negative_cache_key(short_code), 1, ex=NEGATIVE_CACHE_TTL)
+            return None
 
-        # Update `last_used_at` in Redis
-        redis_client.set(f"last_used_at:{short_code}", datetime.utcnow().isoformat())
+        cached_link = CachedLink(link.original_url, to_epoch(link.expires_at), link.is_active != False)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            cache_link(pipe, short_code, cached_link)  # Cache until expiry, at most LINK_CACHE_TTL
+            await pipe.execute()
+        return cached_link
+    finally:
+        if LINK_LOAD_LOCK_MS:
+            await redis_client.eval(RELEASE_LOCK_LUA, 1, lock_key, lock_token)
 
-        return RedirectResponse(url=cached_url)
 
-    # Fetch link from the database
-    result = await session.execute(
-        select(linkdata).where(func.lower(linkdata.c.short_code) == func.lower(short_code), linkdata.c.is_active == True)
-    )
-    link = result.fetchone()
+def client_ip(forwarded_for: Optional[str], peer: Optional[str]) -> Optional[str]:
+    # First hop of X-Forwarded-For when running behind a proxy
+    if forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return peer
 
-    if not link:
-        raise HTTPException(status_code=404, detail="Link not found")
-    if link.expires_at and link.expires_at < datetime.utcnow():
+
+def check_link_state(link: CachedLink, now: float):
+    if link.is_expired(now):
         raise HTTPException(status_code=410, detail="Link has expired")
     if not link.is_active:
         raise HTTPException(status_code=403, detail="Link is deactivated due to inactivity")
 
-    new_usage_count = link.usage_count + 1
-    last_used_at = datetime.utcnow()
 
-    stmt = (
-        update(linkdata)
-        .where(linkdata.c.short_code == short_code, linkdata.c.is_active == True)
-        .values(
-            usage_count=new_usage_count,  # Increment usage_count
-            last_used_at=last_used_at,  # Update last_used_at
-        )
-    )
-    await session.execute(stmt)
-    await session.commit()
-
-    redis_client.setex(f"link:{short_code}", 3600, link.original_url)  # Cache URL for 1 hour
-    redis_client.zadd("usage_count", {short_code: new_usage_count})  # Store updated count in Redis
-    redis_client.set(f"last_used_at:{short_code}", last_used_at.isoformat())  # Store last_used_at in Redis
-
-    return RedirectResponse(url=link.original_url)
+@router.get("/links/top")
+async def get_top_links(
+        n: int = Query(10, ge=1, le=TOP_LINKS_MAX, description="Number of links"),
+        window: str = Query("hour", description="hour or day"),
+        session: AsyncSession = Depends(get_async_session),
+        redis_client: aioredis.Redis = Depends(get_redis)
+):
+    """
+    Most clicked links over the last hour or day, from the leaderboard slots
+    kept by the click aggregator. Refreshed every few seconds.
+    """
+    if window not in TOP_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(TOP_WINDOWS)}")
+    return {"window": window, "links": await top_links(session, redis_client, window, n)}
 
 
 @router.delete("/links/{short_code}", response_model=LinkResponse)
 async def delete_link(
         short_code: str,
         session: AsyncSession = Depends(get_async_session),
-        user: User = Depends(current_active_user)
+        user: User = Depends(current_active_user),
+        redis_client: aioredis.Redis = Depends(get_redis)
 ):
     result = await session.execute(
-        select(linkdata).where(linkdata.c.short_code == short_code)
+        select(linkdata).where(short_code_matches(short_code))
     )
     link = result.fetchone()
 
@@ -165,11 +314,14 @@ async def delete_link(
     if link.user_id != user.id:
         raise HTTPException(status_code=403, detail="You are not the owner of this link")
 
-    await session.execute(delete(linkdata).where(linkdata.c.short_code == short_code, linkdata.c.is_active == True))
+    await session.execute(delete(linkdata).where(linkdata.c.code_id == link.code_id, linkdata.c.is_active == True))
     await session.commit()
 
-    redis_client.delete(f"link:{short_code}")
-    redis_client.zrem("usage_count", short_code)
+    code_key = short_code.lower()
+    await redis_client.delete(f"link:{code_key}")
+    if link.original_url:
+        await redis_client.delete(url_digest_key(url_digest(link.original_url)))
+    await publish_invalidation(redis_client, code_key)
 
     return LinkResponse(short_code=link.short_code, original_url=link.original_url, user_id=link.user_id)
 
@@ -179,10 +331,11 @@ async def update_link(
         short_code: str,
         link_update: LinkUpdate,
         session: AsyncSession = Depends(get_async_session),
-        user: User = Depends(current_active_user)
+        user: User = Depends(current_active_user),
+        redis_client: aioredis.Redis = Depends(get_redis)
 ):
     result = await session.execute(
-        select(linkdata).where(linkdata.c.short_code == short_code, linkdata.c.is_active == True)
+        select(linkdata).where(short_code_matches(short_code), linkdata.c.is_active == True)
     )
     link = result.fetchone()
 
@@ -195,18 +348,22 @@ async def update_link(
     update_values = {}
     if link_update.original_url:
         update_values["original_url"] = link_update.original_url
+        update_values["url_digest"] = url_digest(link_update.original_url)
 
     if link_update.expires_at:
         if isinstance(link_update.expires_at, str):
             link_update.expires_at = datetime.strptime(link_update.expires_at, '%Y-%m-%d %H:%M:%S.%f')
         update_values["expires_at"] = link_update.expires_at
 
-    stmt = update(linkdata).where(linkdata.c.short_code == short_code, linkdata.c.is_active == True).values(update_values)
+    stmt = update(linkdata).where(linkdata.c.code_id == link.code_id, linkdata.c.is_active == True).values(update_values)
     await session.execute(stmt)
     await session.commit()
 
-    redis_client.delete(f"link:{short_code}")
-    redis_client.zrem("usage_count", short_code)
+    code_key = short_code.lower()
+    await redis_client.delete(f"link:{code_key}")
+    if link_update.original_url and link.original_url:
+        await redis_client.delete(url_digest_key(url_digest(link.original_url)))
+    await publish_invalidation(redis_client, code_key)
 
     if hasattr(link_update, 'original_url'):
         original_url = link_update.original_url
@@ -218,89 +375,114 @@ async def update_link(
     else:
         expires_at = None
 
-    return LinkResponse(short_code=short_code, original_url=original_url, expires_at=expires_at, user_id=user.id)
+    return LinkResponse(short_code=link.short_code, original_url=original_url, expires_at=expires_at, user_id=user.id)
 
 
 @router.get("/links/{short_code}/stats")
 async def link_stats(
         short_code: str,
-        session: AsyncSession = Depends(get_async_session)
+        start: Optional[datetime] = Query(None, alias="from", description="Range start (UTC), 7 days before `to` by default"),
+        end: Optional[datetime] = Query(None, alias="to", description="Range end (UTC, exclusive), now by default"),
+        granularity: Optional[str] = Query(None, description="hour or day, with from/to defaults to hour"),
+        session: AsyncSession = Depends(get_async_session),
+        redis_client: aioredis.Redis = Depends(get_redis)
 ):
-    clicks = redis_client.zscore("usage_count", short_code)
-    last_used_at = redis_client.get(f"last_used_at:{short_code}")
-    if clicks is None:
-        result = await session.execute(
-            select(linkdata).where(linkdata.c.short_code == short_code, linkdata.c.is_active == True)
-        )
-        link = result.fetchone()
-        clicks = link.usage_count
-        last_used_at = link.last_used_at
-
-        if not link:
-            raise HTTPException(status_code=404, detail="Link not found")
+    result = await session.execute(
+        select(linkdata).where(short_code_matches(short_code), linkdata.c.is_active == True)
+    )
+    link = result.fetchone()
+    if not link:
+        raise HTTPException(status_code=404, detail="Link not found")
 
     stats = {
         "original_url": link.original_url,
         "created_at": link.created,
-        "clicks": clicks,
-        "last_used_at": last_used_at
+        "clicks": link.usage_count,
+        "last_used_at": link.last_used_at,
+        # HyperLogLog estimates, about 0.8% standard error
+        "unique_visitors": await unique_visitors(session, redis_client, short_code),
     }
 
+    # Clicks over time from the hourly buckets, only when asked for
+    if start is not None or end is not None or granularity is not None:
+        granularity = granularity or "hour"
+        if granularity not in GRANULARITIES:
+            raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+        start, end = parse_range(start, end, granularity)
+        if start >= end:
+            raise HTTPException(status_code=400, detail="from must be before to")
+        stats.update({
+            "from": start,
+            "to": end,
+            "granularity": granularity,
+            "series": await click_series(session, redis_client, short_code, start, end, granularity),
+        })
+
     return stats
 
 @router.get("/links/search", response_model=List[LinkResponse])
 async def search_links_by_original_url(
+    response: Response,
     original_url: str = Query(..., title="Original URL", description="URL to search for"),
+    cursor: Optional[str] = Query(None, description=f"{NEXT_CURSOR_HEADER} of the previous page"),
+    limit: int = Query(LISTING_PAGE_SIZE, ge=1, le=LISTING_MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Every link from the cursor on, as NDJSON"),
     session: AsyncSession = Depends(get_async_session)
 ):
     # Декодируем URL, если он закодирован
     decoded_url = unquote(original_url)
 
     # Ищем ссылки в базе
-    result = await session.execute(
-        select(linkdata).where(linkdata.c.original_url == decoded_url, linkdata.c.is_active == True)
-    )
-    links = result.fetchall()
+    stmt = select(linkdata).where(original_url_matches(decoded_url), linkdata.c.is_active == True)
+    links = await list_links(session, async_session_maker, response, stmt, CREATED_KEYS, cursor, limit, stream)
 
-    if not links:
+    if not stream and not links and cursor is None:
         raise HTTPException(status_code=404, detail="No links found")
 
-    # Преобразуем результат в список словарей
-    return [
-        LinkResponse(
-            short_code=link.short_code,
-            original_url=link.original_url,
-            user_id=link.user_id
-        ) for link in links
-    ]
+    return links
 
 @router.get("/links/expired", response_model=list[LinkResponse])
-async def get_expired_links(session: AsyncSession = Depends(get_async_session)):
+async def get_expired_links(
+    response: Response,
+    cursor: Optional[str] = Query(None, description=f"{NEXT_CURSOR_HEADER} of the previous page"),
+    limit: int = Query(LISTING_PAGE_SIZE, ge=1, le=LISTING_MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Every link from the cursor on, as NDJSON"),
+    session: AsyncSession = Depends(get_async_session)
+):
     # Получаем текущую дату и время
     now = datetime.now()
 
-    # Запрос всех ссылок, срок действия которых истек
-    result = await session.execute(
-        select(linkdata).where(linkdata.c.expires_at < now, linkdata.c.is_active == True)
-    )
-    expired_links = result.fetchall()
+    # Ссылки, срок действия которых истек, по (expires_at, id)
+    stmt = select(linkdata).where(linkdata.c.expires_at < now, linkdata.c.is_active == True)
+    links = await list_links(session, async_session_maker, response, stmt, EXPIRED_KEYS, cursor, limit, stream)
 
-    if not expired_links:
+    if not stream and not links and cursor is None:
         raise HTTPException(status_code=404, detail="No expired links found")
 
-    return [
-        LinkResponse(
-            short_code=link.short_code,
-            original_url=link.original_url,
-            user_id=link.user_id
-        )
-        for link in expired_links
-    ]
+    return links
+
+@router.get("/links/mine", response_model=list[LinkResponse])
+async def get_my_links(
+    response: Response,
+    cursor: Optional[str] = Query(None, description=f"{NEXT_CURSOR_HEADER} of the previous page"),
+    limit: int = Query(LISTING_PAGE_SIZE, ge=1, le=LISTING_MAX_PAGE_SIZE),
+    stream: bool = Query(False, description="Every link from the cursor on, as NDJSON"),
+    session: AsyncSession = Depends(get_async_session),
+    user: Optional[User] = Depends(current_active_user),
+):
+    """
+    The caller's active links, oldest first.
+    """
+    if user is None:
+        raise HTTPException(status_code=403, detail="Only registered users can use this endpoint")
+
+    stmt = select(linkdata).where(linkdata.c.user_id == user.id, linkdata.c.is_active == True)
+    return await list_links(session, async_session_maker, response, stmt, CREATED_KEYS, cursor, limit, stream)
 
 @router.post("/links/deactivate_unused")
 async def deactivate_unused_links(
-    session: AsyncSession = Depends(get_async_session),
     user: Optional[User] = Depends(current_active_user),
+    redis_client: aioredis.Redis = Depends(get_redis),
 ):
     # Check if the user is authenticated
     if user is None:
@@ -314,34 +496,30 @@ async def deactivate_unused_links(
             status_code=403, detail="Only superusers can deactivate links"
         )
 
-    threshold_date = datetime.now() - timedelta(days=int(DEACTIVATION_DAYS))
-    # Find links that haven't been used for N days and are still active
-    result = await session.execute(
-        select(linkdata.c.short_code, linkdata.c.original_url).where(
-            linkdata.c.last_used_at < threshold_date, linkdata.c.is_active == False
-        )
-    )
-    unused_links = result.fetchall()
+    # The Celery job's run: batches under the maintenance lock, progress in
+    # GET /task/maintenance
+    deactivated = await run_deactivation_jobs(async_session_maker, redis_client, ("unused", "never_used"))
+    if deactivated is None:
+        raise HTTPException(status_code=409, detail="A maintenance run is already in progress")
 
-    if not unused_links:
+    total = sum(deactivated.values())
+    if not total:
         return {"message": "No links to deactivate"}
 
-    # Extract short_code and original_url for the response
-    deactivated_links = [
-        {"short_code": link.short_code, "original_url": link.original_url}
-        for link in unused_links
-    ]
-
-    # Update the status of the links to inactive
-    stmt = (
-        update(linkdata)
-        .where(linkdata.c.last_used_at < threshold_date, linkdata.c.is_active == False)
-        .values(is_active=False)
-    )
-    await session.execute(stmt)
-    await session.commit()
+    return {"message": f"Deactivated {total} links", "deactivated": deactivated}
 
+
+@router.get("/cache/stats")
+async def cache_stats(redis_client: aioredis.Redis = Depends(get_redis)):
+    """
+    Per-worker L1 link cache and invalidation bus counters (each gunicorn
+    worker has its own cache), the shared bloom filter and click stream.
+    """
     return {
-        "message": f"Deactivated {len(deactivated_links)} links",
-        "deactivated_links": deactivated_links,
-    }
\ No newline at end of file
+        "pid": os.getpid(),
+        "l1": local_link_cache.stats(),
+        "single_flight": link_loads.stats(),
+        "invalidation": invalidation_stats.stats(),
+        "bloom": await bloom_stats(redis_client),
+        "click_stream": await click_stream_stats(redis_client),
+    }
@@ -1,14 +1,28 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional
 import uuid
 from datetime import datetime
 
+from src.tinylink.codes import is_generated_shape
+
+
+# Custom aliases are a path segment and part of Redis keys ("link:{code}",
+# "hll:{code}:day:..."): letters, digits, "-" and "_" only
+ALIAS_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
 
 class LinkCreate(BaseModel):
     original_url: str
-    custom_alias: Optional[str] = None  # Добавляем поддержку кастомного alias
+    custom_alias: Optional[str] = Field(None, pattern=ALIAS_PATTERN)  # Добавляем поддержку кастомного alias
     expires_at: Optional[str] = None  # Опционально: можно указать срок жизни ссылки
 
+    @field_validator("custom_alias")
+    @classmethod
+    def alias_not_generated(cls, alias: Optional[str]) -> Optional[str]:
+        if alias is not None and is_generated_shape(alias):
+            raise ValueError("Aliases of 6 or 10 letters and digits are reserved for generated codes")
+        return alias
+
 class LinkResponse(BaseModel):
     short_code: str
     original_url: Optional[str] = None
@@ -0,0 +1,70 @@
+from typing import Optional
+
+from redis import asyncio as aioredis
+from redis.commands.core import AsyncScript
+
+
+# Cache-hit redirect in one round-trip: resolve the short code and append a
+# click event to the click stream. Expired and deactivated links are
+# answered from the cached record without emitting an event.
+# On a cache miss the negative cache and the short code bloom filter are
+# consulted, so unknown codes are rejected without a database query.
+# KEYS: link:{code}, click stream, miss:{code}, bloom filter, bloom ready marker
+# ARGV: short_code, now (UTC epoch seconds), referrer host, user-agent class,
+#       visitor hash, bloom bit offsets...
+# The stream is not trimmed here, the aggregator trims what it has applied.
+# Returns
+#   0 if the code definitely does not exist,
+#   nil on a cache miss that has to be resolved from the database,
+#   otherwise {original_url, expires_at, is_active}.
+REDIRECT_LUA = """
+local link = redis.call('HMGET', KEYS[1], 'url', 'exp', 'active')
+if not link[1] then
+    if redis.call('EXISTS', KEYS[3]) == 1 then
+        return 0
+    end
+    if redis.call('EXISTS', KEYS[5]) == 1 then
+        for i = 6, #ARGV do
+            if redis.call('GETBIT', KEYS[4], ARGV[i]) == 0 then
+                return 0
+            end
+        end
+    end
+    return false
+end
+local exp = tonumber(link[2])
+if link[3] == '1' and (exp == 0 or exp > tonumber(ARGV[2])) then
+    redis.call('XADD', KEYS[2], '*',
+        'c', ARGV[1], 't', ARGV[2], 'r', ARGV[3], 'u', ARGV[4], 'v', ARGV[5])
+end
+return link
+"""
+DEFINITE_MISS = 0
+
+# Deletes a lock only if it is still held by the caller's token
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Pushes a lock's expiry out only if it is still held by the caller's token
+EXTEND_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+redirect_script: Optional[AsyncScript] = None
+
+
+async def register_scripts(redis_client: aioredis.Redis) -> None:
+    """
+    Registers the Lua script once per process and preloads it into Redis,
+    so the hot path only sends EVALSHA (redis-py reloads on NOSCRIPT).
+    """
+    global redirect_script
+    redirect_script = redis_client.register_script(REDIRECT_LUA)
+    await redis_client.script_load(REDIRECT_LUA)
@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from src.config import CLICK_BUCKET_RETENTION_DAYS, CLICK_ROLLUP_INTERVAL, VISITOR_HASH_KEY
+from src.tinylink.models import link_unique_visitors
+from src.tinylink.scripts import RELEASE_LOCK_LUA
+
+
+# HyperLogLog of visitor hashes per link and window (about 12KB each once dense):
+# hll:{code}:day:YYYYMMDD, hll:{code}:month:YYYYMM and hll:{code}:all
+VISITORS_KEY = "hll:{short_code}:{period}"
+# Sketches changed since they were last persisted
+VISITORS_DIRTY_KEY = "hll:dirty"
+VISITORS_PERSISTING_KEY = "hll:dirty:persisting"
+VISITORS_PERSIST_LOCK = "hll:persist:lock"
+VISITORS_PERSIST_BATCH_SIZE = 500
+# Day and month sketches stay in Redis a little longer than their window,
+# Postgres keeps them afterwards
+PERIOD_TTL = {"day": 2 * 24 * 60 * 60, "month": 35 * 24 * 60 * 60, "all": None}
+ALL_TIME = date(1970, 1, 1)
+
+# KEYS: dirty set, persisting set; returns 1 if there is something to persist
+SWAP_DIRTY_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return 1
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def visitor_hash(client_ip: Optional[str], user_agent: Optional[str]) -> str:
+    """
+    Keyed hash of the visitor fingerprint, raw IPs never reach Redis.
+    """
+    fingerprint = f"{client_ip or ''}|{user_agent or ''}".encode()
+    return hashlib.blake2b(fingerprint, key=VISITOR_HASH_KEY.encode()[:64], digest_size=8).hexdigest()
+
+
+def visitor_windows(clicked_at: float) -> list[tuple[str, date]]:
+    day = datetime.utcfromtimestamp(clicked_at).date()
+    return [("day", day), ("month", day.replace(day=1)), ("all", ALL_TIME)]
+
+
+def visitors_key(short_code: str, period: str, period_start: date) -> str:
+    if period == "day":
+        window = f"day:{period_start:%Y%m%d}"
+    elif period == "month":
+        window = f"month:{period_start:%Y%m}"
+    else:
+        window = "all"
+    return VISITORS_KEY.format(short_code=short_code, period=window)
+
+
+def parse_visitors_key(key: str) -> tuple[str, str, date]:
+    """
+    Inverse of visitors_key, read from the right: aliases from before their
+    validation may contain ":". Raises ValueError for anything else.
+    """
+    prefix, _, rest = key.partition(":")
+    if prefix != "hll":
+        raise ValueError(f"Not a visitors key: {key!r}")
+    if rest.endswith(":all"):
+        short_code, period, start_date = rest[:-len(":all")], "all", ALL_TIME
+    else:
+        short_code, period, start = rest.rsplit(":", 2)
+        if period not in ("day", "month"):
+            raise ValueError(f"Not a visitors key: {key!r}")
+        start_date = datetime.strptime(start, "%Y%m%d" if period == "day" else "%Y%m").date()
+    if not short_code:
+        raise ValueError(f"Not a visitors key: {key!r}")
+    return short_code, period, start_date
+
+
+def add_visitors(pipe: Pipeline, visitors: dict) -> None:
+    """
+    Queues the PFADDs for {(short_code, period, period_start): {visitor hashes}}.
+    """
+    for (short_code, period, period_start), hashes in visitors.items():
+        key = visitors_key(short_code, period, period_start)
+        pipe.pfadd(key, *hashes)
+        if PERIOD_TTL[period]:
+            pipe.expire(key, PERIOD_TTL[period])
+        pipe.sadd(VISITORS_DIRTY_KEY, key)
+
+
+async def persist_batch(session: AsyncSession, raw_redis: aioredis.Redis, keys: list[str]) -> int:
+    windows = []
+    valid_keys = []
+    for key in keys:
+        try:
+            windows.append(parse_visitors_key(key))
+        except ValueError:
+            # Dropped, or it would fail every run and hold up the others
+            logger.exception("Skipping visitor sketch %r", key)
+            await raw_redis.srem(VISITORS_PERSISTING_KEY, key)
+            continue
+        valid_keys.append(key)
+    keys = valid_keys
+    if not keys:
+        return 0
+    result = await session.execute(
+        select(
+            link_unique_visitors.c.short_code, link_unique_visitors.c.period,
+            link_unique_visitors.c.period_start, link_unique_visitors.c.sketch,
+        ).where(tuple_(
+            link_unique_visitors.c.short_code, link_unique_visitors.c.period, link_unique_visitors.c.period_start,
+        ).in_(windows))
+    )
+    stored = {(row.short_code, row.period, row.period_start): row.sketch for row in result}
+
+    # Merging is a register-wise max, so persisting a sketch twice or after
+    # Redis lost it gives the same result
+    if stored:
+        merge_key = f"hll:merge:{uuid.uuid4().hex}"
+        async with raw_redis.pipeline(transaction=False) as pipe:
+            for key, window in zip(keys, windows):
+                if window in stored:
+                    pipe.set(merge_key, stored[window], ex=60)
+                    pipe.pfmerge(key, key, merge_key)
+                    if PERIOD_TTL[window[1]]:
+                        pipe.expire(key, PERIOD_TTL[window[1]])
+            pipe.delete(merge_key)
+            await pipe.execute()
+
+    async with raw_redis.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.get(key)
+            pipe.pfcount(key)
+        replies = await pipe.execute()
+
+    rows = []
+    for window, sketch, estimate in zip(windows, replies[::2], replies[1::2]):
+        # Expired from Redis before it was persisted, nothing to merge
+        if sketch is None:
+            continue
+        short_code, period, period_start = window
+        rows.append({
+            "short_code": short_code, "period": period, "period_start": period_start,
+            "sketch": sketch, "estimate": estimate, "updated_at": datetime.utcnow(),
+        })
+    if not rows:
+        return 0
+
+    stmt = insert(link_unique_visitors).values(rows)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[link_unique_visitors.c.short_code, link_unique_visitors.c.period,
+                        link_unique_visitors.c.period_start],
+        set_={"sketch": stmt.excluded.sketch, "estimate": stmt.excluded.estimate,
+              "updated_at": stmt.excluded.updated_at},
+    ))
+    await session.commit()
+    return len(rows)
+
+
+async def persist_visitor_sketches(
+    session_maker: async_sessionmaker, redis_client: aioredis.Redis, raw_redis: aioredis.Redis
+) -> int:
+    """
+    Writes the sketches changed since the last run to link_unique_visitors,
+    merged with the stored ones, and drops day rows past the retention.
+    """
+    lock_token = uuid.uuid4().hex
+    if not await redis_client.set(VISITORS_PERSIST_LOCK, lock_token, nx=True, ex=CLICK_ROLLUP_INTERVAL * 2):
+        return 0
+
+    started = time.monotonic()
+    persisted = 0
+    try:
+        async with session_maker() as session:
+            if await redis_client.eval(SWAP_DIRTY_LUA, 2, VISITORS_DIRTY_KEY, VISITORS_PERSISTING_KEY):
+                batch = []
+                async for key in redis_client.sscan_iter(VISITORS_PERSISTING_KEY, count=VISITORS_PERSIST_BATCH_SIZE):
+                    batch.append(key)
+                    if len(batch) == VISITORS_PERSIST_BATCH_SIZE:
+                        persisted += await persist_batch(session, raw_redis, batch)
+                        batch = []
+                if batch:
+                    persisted += await persist_batch(session, raw_redis, batch)
+                await redis_client.delete(VISITORS_PERSISTING_KEY)
+
+            cutoff = datetime.utcnow().date() - timedelta(days=CLICK_BUCKET_RETENTION_DAYS)
+            await session.execute(link_unique_visitors.delete().where(
+                link_unique_visitors.c.period != "all", link_unique_visitors.c.period_start < cutoff,
+            ))
+            await session.commit()
+    finally:
+        await redis_client.eval(RELEASE_LOCK_LUA, 1, VISITORS_PERSIST_LOCK, lock_token)
+
+    if persisted:
+        logger.info("Persisted %s visitor sketches in %.3fs", persisted, time.monotonic() - started)
+    return persisted
+
+
+async def unique_visitors(session: AsyncSession, redis_client: aioredis.Redis, short_code: str) -> dict:
+    """
+    Estimated unique visitors today, this month and overall (UTC). Falls back
+    to the persisted estimate when Redis no longer has the sketch.
+    """
+    short_code = short_code.lower()
+    windows = {period: start for period, start in visitor_windows(time.time())}
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for period, start in windows.items():
+            pipe.pfcount(visitors_key(short_code, period, start))
+        counts = dict(zip(windows, await pipe.execute()))
+
+    result = await session.execute(
+        select(link_unique_visitors.c.period, link_unique_visitors.c.estimate).where(
+            link_unique_visitors.c.short_code == short_code,
+            or_(*[
+                and_(link_unique_visitors.c.period == period, link_unique_visitors.c.period_start == start)
+                for period, start in windows.items()
+            ]),
+        )
+    )
+    for period, estimate in result:
+        counts[period] = max(counts[period], estimate)
+    return {"today": counts["day"], "this_month": counts["month"], "total": counts["all"]}
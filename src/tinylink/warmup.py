@@ -0,0 +1,148 @@
+"""
+Startup warm-up, in place of flushing Redis on every start. The first
+worker of a deployed version takes WARMUP_LOCK, clears the fastapi-cache
+responses and preloads the most used links into the link:{code} hashes;
+every worker then fills its local cache from them.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+
+from redis import asyncio as aioredis
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.future import select
+
+from src.config import L1_CACHE_MAX_ENTRIES, WARMUP_LINKS
+from src.tinylink.cache import LEGACY_URL_DIGEST_KEY, CachedLink, cache_link, local_link_cache, to_epoch
+from src.tinylink.codes import code_id_of
+from src.tinylink.leaderboard import ranked_codes
+from src.tinylink.models import linkdata
+
+
+# One warm-up per deployed version, restarts within the TTL skip it
+WARMUP_LOCK = "warmup:{version}"
+WARMUP_LOCK_TTL = 24 * 60 * 60
+WARMUP_BATCH_SIZE = 1000
+# Links used within this period are ranked by usage_count when the
+# leaderboard has fewer than WARMUP_LINKS codes
+WARMUP_RECENT_DAYS = 1
+
+logger = logging.getLogger(__name__)
+
+
+async def clear_cache_prefix(redis_client: aioredis.Redis, prefix: str) -> int:
+    """
+    Deletes the keys under prefix without blocking Redis: SCAN in batches
+    and UNLINK, other keys are left alone.
+    """
+    deleted = 0
+    batch = []
+    async for key in redis_client.scan_iter(match=f"{prefix}:*", count=WARMUP_BATCH_SIZE):
+        batch.append(key)
+        if len(batch) >= WARMUP_BATCH_SIZE:
+            deleted += await redis_client.unlink(*batch)
+            batch = []
+    if batch:
+        deleted += await redis_client.unlink(*batch)
+    return deleted
+
+
+async def most_used_links(session_maker: async_sessionmaker, redis_client: aioredis.Redis, n: int) -> list:
+    """
+    Up to n active links: the day's leaderboard, then the links used
+    recently with the highest usage_count.
+    """
+    codes = [code for code, _ in await ranked_codes(redis_client, "day", n)]
+    rows = {}
+    async with session_maker() as session:
+        for start in range(0, len(codes), WARMUP_BATCH_SIZE):
+            chunk = codes[start:start + WARMUP_BATCH_SIZE]
+            result = await session.execute(
+                select(linkdata.c.short_code, linkdata.c.original_url, linkdata.c.expires_at).where(
+                    linkdata.c.code_id.in_([code_id_of(code) for code in chunk]),
+                    linkdata.c.is_active == True,
+                )
+            )
+            rows.update((row.short_code.lower(), row) for row in result)
+        if len(rows) < n:
+            result = await session.execute(
+                select(linkdata.c.short_code, linkdata.c.original_url, linkdata.c.expires_at)
+                .where(
+                    linkdata.c.is_active == True,
+                    linkdata.c.last_used_at >= datetime.utcnow() - timedelta(days=WARMUP_RECENT_DAYS),
+                )
+                .order_by(linkdata.c.usage_count.desc())
+                .limit(n)
+            )
+            for row in result:
+                if len(rows) >= n:
+                    break
+                rows.setdefault(row.short_code.lower(), row)
+    return list(rows.values())
+
+
+async def preload_links(redis_client: aioredis.Redis, rows: list) -> int:
+    now = time.time()
+    preloaded = 0
+    for start in range(0, len(rows), WARMUP_BATCH_SIZE):
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for row in rows[start:start + WARMUP_BATCH_SIZE]:
+                link = CachedLink(row.original_url, to_epoch(row.expires_at), True)
+                if link.is_expired(now):
+                    continue
+                cache_link(pipe, row.short_code.lower(), link)
+                preloaded += 1
+            await pipe.execute()
+    return preloaded
+
+
+async def fill_local_cache(redis_client: aioredis.Redis, n: int) -> int:
+    """
+    Copies the day's top links that are cached in Redis into this worker's
+    local cache, one pipelined HMGET per batch.
+    """
+    codes = [code for code, _ in await ranked_codes(redis_client, "day", min(n, L1_CACHE_MAX_ENTRIES))]
+    filled = 0
+    for start in range(0, len(codes), WARMUP_BATCH_SIZE):
+        chunk = codes[start:start + WARMUP_BATCH_SIZE]
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for short_code in chunk:
+                pipe.hmget(f"link:{short_code}", "url", "exp", "active")
+            cached = await pipe.execute()
+        for short_code, fields in zip(chunk, cached):
+            if fields[0] is not None:
+                local_link_cache.set(short_code, CachedLink.from_redis(*fields))
+                filled += 1
+    return filled
+
+
+async def warm_up(
+    session_maker: async_sessionmaker,
+    redis_client: aioredis.Redis,
+    version: str,
+    cache_prefix: str,
+    n: int = WARMUP_LINKS,
+) -> dict:
+    """
+    Returns what was done; "preloaded" is None in the workers that found the
+    warm-up already taken.
+    """
+    started = time.monotonic()
+    cleared = preloaded = None
+    lock = WARMUP_LOCK.format(version=version)
+    if n > 0 and await redis_client.set(lock, 1, nx=True, ex=WARMUP_LOCK_TTL):
+        try:
+            cleared = await clear_cache_prefix(redis_client, cache_prefix)
+            await redis_client.unlink(LEGACY_URL_DIGEST_KEY)
+            preloaded = await preload_links(redis_client, await most_used_links(session_maker, redis_client, n))
+        except Exception:
+            # The next worker to start takes the warm-up over
+            await redis_client.delete(lock)
+            raise
+    filled = await fill_local_cache(redis_client, n) if n > 0 else 0
+    if preloaded is not None:
+        logger.info(
+            "Warm-up: %s cached responses cleared, %s links preloaded, %s in the local cache in %.1fs",
+            cleared, preloaded, filled, time.monotonic() - started,
+        )
+    return {"cleared": cleared, "preloaded": preloaded, "local": filled}
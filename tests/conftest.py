@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+
+# src/config.py reads the settings at import time, the engine only connects
+# when a test uses it
+for name, default in (
+    ("DB_USER", "postgres"), ("DB_PASS", ""), ("DB_HOST", "localhost"), ("DB_PORT", "5432"), ("DB_NAME", "tinylink"),
+    ("SECRET", "test"), ("ALGORITHM", "HS256"), ("DEACTIVATION_DAYS", "30"),
+):
+    os.environ.setdefault(name, default)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
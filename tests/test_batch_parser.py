@@ -0,0 +1,63 @@
+"""
+iter_json_items (src/tinylink/batch.py) reads JSON arrays and NDJSON in
+chunks; every case runs with a chunk size small enough to split the items.
+"""
+import io
+import json
+
+import pytest
+
+from src.tinylink import batch
+
+
+@pytest.fixture(params=[batch.BATCH_READ_SIZE, 1, 3], ids=["whole", "1-byte", "3-byte"])
+def parse(request, monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_READ_SIZE", request.param)
+
+    def parse(body: str) -> list:
+        return list(batch.iter_json_items(io.BytesIO(body.encode())))
+
+    return parse
+
+
+@pytest.mark.parametrize("body, items", [
+    ('["https://a.example", {"original_url": "https://b.example"}]',
+     ["https://a.example", {"original_url": "https://b.example"}]),
+    (' [ 1 , 2 ]\n', [1, 2]),
+    ('[]', []),
+    ('[ ]', []),
+    ('', []),
+    ('"https://a.example"\n{"original_url": "https://b.example"}\n',
+     ["https://a.example", {"original_url": "https://b.example"}]),
+    ('12345 678', [12345, 678]),
+    ('["ünïcode", "日本"]', ["ünïcode", "日本"]),
+])
+def test_items(parse, body, items):
+    assert parse(body) == items
+
+
+@pytest.mark.parametrize("body, message", [
+    ('[1,]', "Expecting value"),
+    ('[1,,2]', "Expecting value"),
+    ('[,1]', "Expecting value"),
+    (',1', "Expecting value"),
+    ('1]', "Expecting value"),
+    ('[1 2]', "Expecting ',' delimiter"),
+    ('[1]]', "Extra data"),
+    ('[1] 2', "Extra data"),
+    ('[] []', "Extra data"),
+    ('[1, 2', "Unterminated array"),
+    ('[', "Unterminated array"),
+    ('[1, {"a": ', "Expecting value"),
+])
+def test_malformed(parse, body, message):
+    with pytest.raises(json.JSONDecodeError, match=message):
+        parse(body)
+
+
+def test_items_before_the_error_are_yielded():
+    items = batch.iter_json_items(io.BytesIO(b'[1, 2, oops]'))
+    assert next(items) == 1
+    assert next(items) == 2
+    with pytest.raises(json.JSONDecodeError):
+        next(items)
@@ -0,0 +1,27 @@
+"""
+Partition keys of short codes (src/tinylink/codes.py:code_id_of) and the
+aliases that may not take one of the generated ranges.
+"""
+import pytest
+from pydantic import ValidationError
+
+from src.tinylink.codes import ANONYMOUS_ID_START, code_id_of, code_permutations
+from src.tinylink.schemas import LinkCreate
+
+
+@pytest.mark.parametrize("length, code_id", [(6, 0), (6, ANONYMOUS_ID_START - 1), (10, ANONYMOUS_ID_START), (10, 10**12)])
+def test_generated_codes_decode(length, code_id):
+    short_code = code_permutations[length].encode(code_id)
+    assert code_id_of(short_code) == code_id_of(short_code.upper()) == code_id
+
+
+@pytest.mark.parametrize("alias", ["my-alias", "a", "abc_12", "release-2026", "x" * 64])
+def test_aliases_are_hashed(alias):
+    assert LinkCreate(original_url="https://a.example", custom_alias=alias).custom_alias == alias
+    assert code_id_of(alias) < 0
+
+
+@pytest.mark.parametrize("alias", ["abc123", "ABC123", "summer2026", "SummerSale"])
+def test_generated_shapes_are_rejected(alias):
+    with pytest.raises(ValidationError, match="reserved for generated codes"):
+        LinkCreate(original_url="https://a.example", custom_alias=alias)
@@ -0,0 +1,144 @@
+"""
+The linkdata queries are served by the indexes of the migrations. EXPLAINs
+the statements the app builds against a database migrated to head:
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/tinylink_test pytest tests/test_linkdata_indexes.py
+
+Skipped without TEST_DATABASE_URL or when the database is unreachable.
+Nothing is written.
+"""
+import os
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.future import select
+
+from src.tasks.maintenance import deactivation_condition
+from src.tinylink.listing import CREATED_KEYS, EXPIRED_KEYS, encode_cursor, keyset
+from src.tinylink.models import linkdata, original_url_matches, short_code_matches
+
+pytestmark = pytest.mark.anyio
+
+DEACTIVATION_INDEXES = {
+    "unused": "ix_linkdata_active_last_used_at",
+    "expired": "ix_linkdata_active_expires_at_id",
+    "never_used": "ix_linkdata_active_unused_created",
+}
+
+
+@pytest.fixture
+async def explain():
+    """
+    Runs a statement as EXPLAIN (FORMAT JSON) and returns the parent-table
+    indexes its scans use and the plan node types. Sequential and bitmap
+    scans are disabled, the test tables are too small for the planner to
+    prefer an ordered index scan on its own.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = create_async_engine(make_url(url).set(drivername="postgresql+asyncpg"))
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute", retval=True)
+    def as_explain(conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get("explain"):
+            statement = "EXPLAIN (FORMAT JSON) " + statement
+        return statement, parameters
+
+    try:
+        conn = await engine.connect()
+    except Exception as e:
+        await engine.dispose()
+        pytest.skip(f"No database at TEST_DATABASE_URL: {e}")
+    try:
+        # Partition index -> the linkdata index it was created from
+        result = await conn.execute(text(
+            "SELECT child.relname, parent.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE child.relkind = 'i'"
+        ))
+        parents = dict(result.fetchall())
+        await conn.execute(text("SET enable_seqscan = off"))
+        await conn.execute(text("SET enable_bitmapscan = off"))
+
+        async def run(stmt) -> SimpleNamespace:
+            conn.sync_connection.info["explain"] = True
+            try:
+                plan = (await conn.execute(stmt)).scalar()
+            finally:
+                conn.sync_connection.info["explain"] = False
+            nodes = list(plan_nodes(plan[0]["Plan"]))
+            return SimpleNamespace(
+                indexes={parents.get(node["Index Name"], node["Index Name"]) for node in nodes if "Index Name" in node},
+                node_types={node["Node Type"] for node in nodes},
+                relations={node["Relation Name"] for node in nodes if "Relation Name" in node},
+            )
+
+        yield run
+    finally:
+        await conn.rollback()
+        await conn.close()
+        await engine.dispose()
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from plan_nodes(child)
+
+
+async def test_short_code_lookup_probes_one_partition(explain):
+    plan = await explain(select(linkdata).where(short_code_matches("AbC123")))
+    assert plan.indexes == {"linkdata_pkey"}
+    assert plan.relations == {"linkdata_registered"}
+    assert "Seq Scan" not in plan.node_types
+
+
+@pytest.mark.parametrize("job", DEACTIVATION_INDEXES)
+async def test_deactivation_candidates_use_partial_index(explain, job):
+    # The candidate query of src/tasks/maintenance.py:deactivate_batch
+    plan = await explain(
+        select(linkdata.c.code_id)
+        .where(linkdata.c.is_active == True, deactivation_condition(job, datetime.utcnow()))
+        .limit(1000)
+        .with_for_update(skip_locked=True)
+    )
+    assert plan.indexes == {DEACTIVATION_INDEXES[job]}
+    assert "Seq Scan" not in plan.node_types
+
+
+async def test_url_dedupe_uses_digest_index(explain):
+    plan = await explain(
+        select(linkdata).where(
+            original_url_matches("https://example.com/page"),
+            linkdata.c.is_active == True,
+            linkdata.c.expires_at > datetime.utcnow(),
+        )
+    )
+    assert plan.indexes == {"ix_linkdata_active_url_digest"}
+    assert "Seq Scan" not in plan.node_types
+
+
+async def test_expired_listing_walks_expiry_index(explain):
+    cursor = encode_cursor(SimpleNamespace(expires_at=datetime(2024, 1, 1), id=uuid.uuid4()), EXPIRED_KEYS)
+    stmt = select(linkdata).where(linkdata.c.expires_at < datetime.utcnow(), linkdata.c.is_active == True)
+    plan = await explain(keyset(stmt, EXPIRED_KEYS, cursor).limit(101))
+    assert plan.indexes == {"ix_linkdata_active_expires_at_id"}
+    assert "Seq Scan" not in plan.node_types
+    # Read in index order, no sort of the matching rows
+    assert "Sort" not in plan.node_types
+
+
+async def test_user_listing_walks_user_index(explain):
+    cursor = encode_cursor(SimpleNamespace(created=datetime(2024, 1, 1), id=uuid.uuid4()), CREATED_KEYS)
+    stmt = select(linkdata).where(linkdata.c.user_id == str(uuid.uuid4()), linkdata.c.is_active == True)
+    plan = await explain(keyset(stmt, CREATED_KEYS, cursor).limit(101))
+    assert plan.indexes == {"ix_linkdata_user_id_created"}
+    assert "Seq Scan" not in plan.node_types
+    assert "Sort" not in plan.node_types
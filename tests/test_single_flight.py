@@ -0,0 +1,82 @@
+"""
+Concurrent redirect misses for one code are loaded once per worker
+(SingleFlight, src/tinylink/cache.py), every request still records its click.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from src.tinylink import router, scripts
+from src.tinylink.cache import link_loads, local_link_cache
+from src.tinylink.events import CLICK_STREAM
+
+pytestmark = pytest.mark.anyio
+
+CONCURRENT_MISSES = 50
+
+
+class CountingSessionMaker:
+    """
+    Stands in for async_session_maker: records the statements and answers
+    each with the link row, slowly enough for the requests to overlap.
+    """
+
+    def __init__(self, row):
+        self.row = row
+        self.statements = []
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(fetchone=lambda: self.row)
+
+
+@pytest.fixture
+async def redis_client(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(scripts, "redirect_script", None)
+    await scripts.register_scripts(client)
+    local_link_cache.clear()
+    yield client
+    local_link_cache.clear()
+    await client.aclose()
+
+
+async def test_concurrent_misses_load_once(monkeypatch, redis_client):
+    row = SimpleNamespace(
+        original_url="https://example.com/page", expires_at=datetime.utcnow() + timedelta(days=1), is_active=True
+    )
+    session_maker = CountingSessionMaker(row)
+    monkeypatch.setattr(router, "async_session_maker", session_maker)
+    # Without the cross-worker lock, only SingleFlight stands between the
+    # requests and the database
+    monkeypatch.setattr(router, "LINK_LOAD_LOCK_MS", 0)
+    loads, coalesced = link_loads.loads, link_loads.coalesced
+
+    links = await asyncio.gather(*(
+        router.resolve_redirect("AbC123", None, "Mozilla/5.0", f"10.0.0.{i}", redis_client)
+        for i in range(CONCURRENT_MISSES)
+    ))
+
+    assert {link.original_url for link in links} == {row.original_url}
+    assert len(session_maker.statements) == 1
+    statement = session_maker.statements[0]
+    assert statement.is_select
+    assert [table.name for table in statement.get_final_froms()] == ["linkdata"]
+    assert link_loads.loads - loads == 1
+    assert link_loads.coalesced - coalesced == CONCURRENT_MISSES - 1
+    assert await redis_client.xlen(CLICK_STREAM) == CONCURRENT_MISSES
+    assert await redis_client.hget("link:abc123", "url") == row.original_url
@@ -0,0 +1,21 @@
+"""
+Visitor sketch keys (src/tinylink/visitors.py) parse back to their window,
+whatever the short code contains.
+"""
+from datetime import date
+
+import pytest
+
+from src.tinylink.visitors import ALL_TIME, parse_visitors_key, visitors_key
+
+
+@pytest.mark.parametrize("short_code", ["abc123", "my-alias_1", "a:b", "a:b:day", "all"])
+@pytest.mark.parametrize("period, period_start", [("day", date(2026, 1, 2)), ("month", date(2026, 1, 1)), ("all", ALL_TIME)])
+def test_round_trip(short_code, period, period_start):
+    assert parse_visitors_key(visitors_key(short_code, period, period_start)) == (short_code, period, period_start)
+
+
+@pytest.mark.parametrize("key", ["hll:abc:week:2026", "hll:day:20260102", "hll::all", "hll:abc:day:2026", "clicks:abc:all"])
+def test_malformed(key):
+    with pytest.raises(ValueError):
+        parse_visitors_key(key)